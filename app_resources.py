@@ -1,16 +1,49 @@
 import os
 from dotenv import load_dotenv
 from pymongo import MongoClient
-from sentence_transformers import SentenceTransformer
+from sentence_transformers import CrossEncoder, SentenceTransformer
 import pinecone
 import streamlit as st
 
+from cache_store import SqliteCache
+from conversation_store import ConversationStore
+from embedding_service import EMBEDDING_MODEL_NAME, EmbeddingService
+from reranker import RERANKER_MODEL_NAME
+from vector_store import LAW_SECTION_SEARCH, SECTION_INDEX_NAME, LocalVectorIndex
+
 load_dotenv()
 
+# Set EMBEDDING_DISK_CACHE=0 to keep query embeddings in memory only
+EMBEDDING_DISK_CACHE = os.getenv("EMBEDDING_DISK_CACHE", "1") == "1"
+EMBEDDING_MEMORY_CACHE_SIZE = int(os.getenv("EMBEDDING_MEMORY_CACHE_SIZE", "2048"))
+EMBEDDING_DISK_CACHE_SIZE = int(os.getenv("EMBEDDING_DISK_CACHE_SIZE", "50000"))
+# "pinecone", or "local" for the file-backed index in vector_store.py
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+# Most Pinecone queries in flight at once; also sizes each index's HTTP connection pool
+PINECONE_MAX_CONCURRENCY = int(os.getenv("PINECONE_MAX_CONCURRENCY", "8"))
+# Set RERANKER=0 to rank matches by vector similarity only
+RERANKER_ENABLED = os.getenv("RERANKER", "1") == "1"
+
 
 @st.cache_resource
 def load_embedding_model():
-    return SentenceTransformer("intfloat/multilingual-e5-large")
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+
+@st.cache_resource
+def load_embedding_service():
+    disk_cache = (SqliteCache("embeddings", max_entries=EMBEDDING_DISK_CACHE_SIZE)
+                  if EMBEDDING_DISK_CACHE else None)
+    return EmbeddingService(load_embedding_model(), EMBEDDING_MODEL_NAME,
+                            memory_size=EMBEDDING_MEMORY_CACHE_SIZE, disk_cache=disk_cache)
+
+
+@st.cache_resource
+def load_reranker():
+    """The shared cross-encoder, or None when RERANKER=0; only pages that rerank call it."""
+    if not RERANKER_ENABLED:
+        return None
+    return CrossEncoder(RERANKER_MODEL_NAME, max_length=512, device="cpu")
 
 
 @st.cache_resource
@@ -19,13 +52,55 @@ def init_pinecone_client():
     return pinecone.Pinecone(api_key=pinecone_api_key)
 
 
+@st.cache_resource
+def get_pinecone_index(name):
+    """One pooled index handle per process, shared across reruns and sessions."""
+    return init_pinecone_client().Index(name, connection_pool_maxsize=PINECONE_MAX_CONCURRENCY)
+
+
+@st.cache_resource
+def get_vector_index(name):
+    """Vector index `name` on the configured backend; both expose Pinecone's `query`."""
+    if VECTOR_BACKEND == "local":
+        return LocalVectorIndex(name)
+    return get_pinecone_index(name)
+
+
+@st.cache_resource(show_spinner=False)
+def get_law_section_index():
+    """The laws-sections index, or None when section search is off or the index can't be opened.
+
+    Pinecone looks the index up by name, so a missing index would otherwise
+    fail the importing page. An index that opens may still be empty or only
+    partly built (the local backend and PineconeWriter both create it empty),
+    so callers also fall back to the laws-names index when it returns no matches.
+    """
+    if not LAW_SECTION_SEARCH:
+        return None
+    try:
+        return get_vector_index(SECTION_INDEX_NAME)
+    except Exception:
+        return None
+
+
 @st.cache_resource
 def get_mongo_client():
     mongo_uri = os.getenv("MONGO_URI")
     return MongoClient(mongo_uri)
 
 
+@st.cache_resource
+def get_conversation_store():
+    store = ConversationStore(get_mongo_client()[os.getenv("DATABASE_NAME")]["conversations"])
+    try:
+        store.ensure_indexes()
+    except Exception as e:
+        st.warning(f"Could not create conversation indexes: {str(e)}")
+    return store
+
+
 # EXPORT CACHED INSTANCES
 model = load_embedding_model()
-pinecone_client = init_pinecone_client()
+embedder = load_embedding_service()
+pinecone_client = init_pinecone_client() if VECTOR_BACKEND == "pinecone" else None
 mongo_client = get_mongo_client()
@@ -0,0 +1,17 @@
+"""One worker pool for the app's background jobs.
+
+Document extraction and classification and conversation loads all run here,
+shared by every session of the process; the jobs are short Mongo reads, file
+parsing or single model calls.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "8"))
+
+_pool = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="background")
+
+
+def run_in_background(fn, *args, **kwargs):
+    """Future for fn(*args, **kwargs) on the shared pool."""
+    return _pool.submit(fn, *args, **kwargs)
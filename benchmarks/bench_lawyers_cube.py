@@ -0,0 +1,91 @@
+"""Compare per-selection filtering with the precomputed top-lawyers cube on enlarged copies of the lawyers CSV.
+
+The dataset is scaled by repeating its rows, each copy with its own set of
+lawyer names, so both the row count and the number of lawyers grow.
+
+Usage:
+    python benchmarks/bench_lawyers_cube.py [--scales 1 10 100] [--repeat 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from lawyers_data import ALL, TOP_LAWYERS, TopLawyersCube, load_lawyers  # noqa: E402
+
+
+def timed(fn, repeat):
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def scaled(df, factor):
+    """`df` repeated `factor` times, with copy i's lawyers renamed "<name> #i"."""
+    if factor == 1:
+        return df
+    names = df["LawyerName"].cat.categories
+    codes = df["LawyerName"].cat.codes.to_numpy().astype(np.int64)
+    big = pd.concat([df] * factor, ignore_index=True)
+    big["LawyerName"] = pd.Categorical.from_codes(
+        np.concatenate([codes + i * len(names) for i in range(factor)]),
+        categories=[f"{name} #{i}" if i else name for i in range(factor) for name in names],
+    )
+    return big
+
+
+def filter_path(df, procedure, court):
+    # What the page did per rerun: mask the frame, group and sort
+    filtered = df
+    if procedure != ALL:
+        filtered = filtered[filtered["ProcedureType"] == procedure]
+    if court != ALL:
+        filtered = filtered[filtered["CourtType"] == court]
+    return (
+        filtered.groupby("LawyerName", observed=True)
+        .size()
+        .reset_index(name="Count")
+        .sort_values("Count", ascending=False)
+        .head(TOP_LAWYERS)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    base = load_lawyers()
+    selections = [
+        (procedure, court)
+        for procedure in [ALL] + list(base["ProcedureType"].cat.categories)
+        for court in [ALL] + list(base["CourtType"].cat.categories)
+    ]
+    print(f"{len(base)} rows, {len(selections)} filter combinations per pass\n")
+
+    print(f"{'scale':>6} {'rows':>9} {'lawyers':>8} {'build ms':>10} "
+          f"{'filter ms/sel':>14} {'cube ms/sel':>12} {'speedup':>8}")
+    for factor in args.scales:
+        df = scaled(base, factor)
+        build_ms, cube = timed(lambda: TopLawyersCube(df), 1)
+        filter_ms, _ = timed(lambda: [filter_path(df, *selection) for selection in selections], args.repeat)
+        lookup_ms, _ = timed(lambda: [cube.top_lawyers(*selection) for selection in selections], args.repeat)
+        filter_ms /= len(selections)
+        lookup_ms /= len(selections)
+        print(f"{factor:>5}x {len(df):>9} {len(df['LawyerName'].cat.categories):>8} {build_ms:>10.1f} "
+              f"{filter_ms:>14.3f} {lookup_ms:>12.4f} {filter_ms / max(lookup_ms, 1e-6):>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
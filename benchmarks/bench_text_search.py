@@ -0,0 +1,72 @@
+"""Compare the regex Name filter with the full-text index used by the search page.
+
+Usage:
+    python benchmarks/bench_text_search.py [--collection judgments] [--repeat 5] [QUERY ...]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from text_search import TextIndex  # noqa: E402
+
+DEFAULT_QUERIES = ["חוק", "עבודה", "חוזה", "פיצויי פיטורים", "בית משפט"]
+PAGE_SIZE = 10
+
+
+def timed(fn, repeat):
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def regex_path(collection, query):
+    # What the page did per rerun: count plus the first page sorted by key
+    filters = {"Name": {"$regex": query, "$options": "i"}}
+    total = collection.count_documents(filters)
+    list(collection.find(filters, {"_id": 1}).sort("_id", 1).limit(PAGE_SIZE))
+    return total
+
+
+def index_path(index, collection, query):
+    ranked = index.search(query)
+    page_ids = [doc_id for doc_id, _ in ranked[:PAGE_SIZE]]
+    list(collection.find({"_id": {"$in": page_ids}}, {"_id": 1}))
+    return len(ranked)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("queries", nargs="*", default=DEFAULT_QUERIES)
+    parser.add_argument("--collection", default="judgments", choices=["laws", "judgments"])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    load_dotenv()
+    collection = MongoClient(os.getenv("MONGO_URI"))[os.getenv("DATABASE_NAME")][args.collection]
+
+    start = time.perf_counter()
+    index = TextIndex.from_collection(collection)
+    print(f"Built index over {len(index)} {args.collection} in "
+          f"{(time.perf_counter() - start):.1f}s ({len(index.postings)} terms)\n")
+
+    print(f"{'query':<20} {'regex ms':>10} {'hits':>7} {'index ms':>10} {'hits':>7} {'speedup':>8}")
+    for query in args.queries:
+        regex_ms, regex_hits = timed(lambda: regex_path(collection, query), args.repeat)
+        index_ms, index_hits = timed(lambda: index_path(index, collection, query), args.repeat)
+        print(f"{query:<20} {regex_ms:>10.1f} {regex_hits:>7} {index_ms:>10.1f} {index_hits:>7} "
+              f"{regex_ms / max(index_ms, 1e-3):>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
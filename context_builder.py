@@ -0,0 +1,164 @@
+"""Fit chat history, document excerpts and retrieved sources into a token budget.
+
+Token counts use tiktoken when it is installed and a characters-per-token
+estimate otherwise. History that doesn't fit is folded into a running summary,
+cached per conversation, so each turn only summarizes the messages that fell
+out of the window since the last one.
+"""
+import json
+import math
+import os
+from functools import lru_cache
+
+from cache_store import shared_cache
+
+try:
+    import tiktoken
+except ImportError:  # optional; counts fall back to CHARS_PER_TOKEN
+    tiktoken = None
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# Share of CONTEXT_TOKEN_BUDGET for each part of the prompt
+CONTEXT_SHARES = {"document": 0.25, "sources": 0.35, "history": 0.40}
+# Estimate used without tiktoken; Hebrew text runs denser than English
+CHARS_PER_TOKEN = 2.5
+# Chat-format overhead per message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Snippets with less room than this left are dropped rather than cut
+MIN_SNIPPET_TOKENS = 50
+
+SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_TOKENS = 400
+# Most recent part of the transcript sent per summary update
+SUMMARY_INPUT_TOKENS = 3000
+
+
+# ------------------------------------------------------------
+# Token counting
+# ------------------------------------------------------------
+@lru_cache(maxsize=None)
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model=SUMMARY_MODEL):
+    encoding = _encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model=SUMMARY_MODEL, keep="start"):
+    """`text` cut to `max_tokens`, keeping its start or (keep="end") its end."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding(model)
+    if encoding is None:
+        max_chars = int(max_tokens * CHARS_PER_TOKEN)
+        return text[:max_chars] if keep == "start" else text[-max_chars:]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens] if keep == "start" else tokens[-max_tokens:])
+
+
+def budget_for(part, total=CONTEXT_TOKEN_BUDGET):
+    return int(total * CONTEXT_SHARES[part])
+
+
+# ------------------------------------------------------------
+# Fitting
+# ------------------------------------------------------------
+def fit_snippets(snippets, max_tokens, model=SUMMARY_MODEL):
+    """Keep ranked snippets while they fit; the first that doesn't is cut to the remaining room."""
+    kept, remaining = [], max_tokens
+    for snippet in snippets:
+        tokens = count_tokens(snippet, model)
+        if tokens <= remaining:
+            kept.append(snippet)
+            remaining -= tokens
+            continue
+        if remaining >= MIN_SNIPPET_TOKENS:
+            kept.append(truncate_to_tokens(snippet, remaining, model))
+        break
+    return kept
+
+
+def split_history(messages, max_tokens, model=SUMMARY_MODEL):
+    """(older, recent): the newest messages that fit in `max_tokens`, and everything before them."""
+    used, cut = 0, len(messages)
+    while cut > 0:
+        tokens = count_tokens(messages[cut - 1]["content"], model) + MESSAGE_OVERHEAD_TOKENS
+        if used + tokens > max_tokens:
+            break
+        used += tokens
+        cut -= 1
+    return messages[:cut], messages[cut:]
+
+
+# ------------------------------------------------------------
+# Running summaries of older turns
+# ------------------------------------------------------------
+SUMMARY_PROMPT = (
+    "אתה מסכם שיחה בין משתמש לעוזר משפטי. עדכן את הסיכום הקיים עם ההודעות החדשות. "
+    "שמור את כל העובדות, המועדים, הסכומים, הצדדים, המסמכים והשאלות שטרם נענו. "
+    "כתוב בעברית, בתמציתיות, בלי להמציא מידע."
+)
+
+
+SUMMARY_CACHE = "history_summaries"
+
+
+def running_summary(chat_id):
+    """(summary, covered): the cached summary of the conversation's first `covered` messages."""
+    cached = shared_cache(SUMMARY_CACHE).get(chat_id)
+    if cached is None:
+        return "", 0
+    data = json.loads(cached)
+    return data["summary"], data["covered"]
+
+
+def forget_summary(chat_id):
+    shared_cache(SUMMARY_CACHE).set(chat_id, json.dumps({"summary": "", "covered": 0}))
+
+
+def openai_summarizer(client, model=SUMMARY_MODEL):
+    """summarize(previous_summary, transcript) backed by an OpenAI chat model."""
+    def summarize(previous, transcript):
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"סיכום קיים:\n{previous or '(אין)'}\n\nהודעות חדשות:\n{transcript}"},
+            ],
+            temperature=0,
+            max_tokens=SUMMARY_MAX_TOKENS,
+        )
+        return response.choices[0].message.content.strip()
+    return summarize
+
+
+def update_summary(chat_id, older, older_start, summarize, model=SUMMARY_MODEL):
+    """Fold `older` (the messages at positions older_start...) into the running summary.
+
+    Only messages the cached summary doesn't cover yet are sent to
+    `summarize`. If it fails, the previous summary is returned and the cache
+    is left as it was, so the messages are retried next turn.
+    """
+    summary, covered = running_summary(chat_id)
+    end = older_start + len(older)
+    if end <= covered:
+        return summary
+    new = older[max(0, covered - older_start):]
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in new)
+    try:
+        summary = summarize(summary, truncate_to_tokens(transcript, SUMMARY_INPUT_TOKENS, model, keep="end"))
+    except Exception:
+        return summary
+    shared_cache(SUMMARY_CACHE).set(chat_id, json.dumps({"summary": summary, "covered": end}, ensure_ascii=False))
+    return summary
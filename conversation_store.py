@@ -0,0 +1,75 @@
+import os
+
+# Messages loaded when a chat opens, and per "load earlier" click
+CONVERSATION_PAGE_SIZE = int(os.getenv("CONVERSATION_PAGE_SIZE", "50"))
+
+
+class ConversationStore:
+    """Append-only access to the `conversations` collection.
+
+    Keeps the existing schema, one document per chat:
+    {"local_storage_id", "user_name", "messages": [...]}, plus a
+    "message_count" kept in step with `$inc`. New messages are `$push`ed, so
+    a turn writes only its own messages instead of the whole history, and
+    loads `$slice` a window of the most recent messages.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index("local_storage_id")
+
+    def _window(self, chat_id, start=None, limit=CONVERSATION_PAGE_SIZE):
+        """One aggregation returning user_name, message_count, the array size and a slice of messages.
+
+        `start=None` selects the last `limit` messages.
+        """
+        messages = {"$ifNull": ["$messages", []]}
+        window = [messages, -limit] if start is None else [messages, start, limit]
+        pipeline = [
+            {"$match": {"local_storage_id": chat_id}},
+            {"$limit": 1},
+            {"$project": {
+                "_id": 0,
+                "user_name": 1,
+                "message_count": 1,
+                "size": {"$size": messages},
+                "messages": {"$slice": window},
+            }},
+        ]
+        return next(self.collection.aggregate(pipeline), None)
+
+    def load_recent(self, chat_id, limit=CONVERSATION_PAGE_SIZE):
+        """(user_name, last `limit` messages, total message count); (None, [], 0) for a new chat."""
+        doc = self._window(chat_id, limit=limit)
+        if doc is None:
+            return None, [], 0
+        if "message_count" not in doc:
+            # Backfill documents written before message_count existed, so later $inc's add up
+            self.collection.update_one(
+                {"local_storage_id": chat_id, "message_count": {"$exists": False}},
+                {"$set": {"message_count": doc["size"]}},
+            )
+        return doc.get("user_name"), doc["messages"], doc["size"]
+
+    def load_earlier(self, chat_id, before, limit=CONVERSATION_PAGE_SIZE):
+        """The up to `limit` messages stored just before position `before`."""
+        start = max(0, before - limit)
+        if before <= start:
+            return []
+        doc = self._window(chat_id, start=start, limit=before - start)
+        return doc["messages"] if doc else []
+
+    def append(self, chat_id, messages, user_name=None):
+        """Push `messages` onto the chat, creating it if needed."""
+        update = {
+            "$push": {"messages": {"$each": list(messages)}},
+            "$inc": {"message_count": len(messages)},
+        }
+        if user_name is not None:
+            update["$set"] = {"user_name": user_name}
+        self.collection.update_one({"local_storage_id": chat_id}, update, upsert=True)
+
+    def delete(self, chat_id):
+        self.collection.delete_one({"local_storage_id": chat_id})
@@ -0,0 +1,86 @@
+"""Document-type classification for uploaded documents.
+
+A keyword override, checked first with precompiled patterns, decides the type
+without calling the model. Otherwise gpt-3.5-turbo classifies a sample of the
+text. Results are cached on disk by the document's content hash, so a
+document is classified once across sessions, and classification runs on a
+worker thread.
+"""
+import re
+
+from background import run_in_background
+from cache_store import shared_cache, versioned_key
+
+CLASSIFIER_MODEL = "gpt-3.5-turbo"
+# Version of CLS_PROMPT and KEYWORD_OVERRIDES in cache keys
+CLASSIFIER_VERSION = 1
+DEFAULT_DOC_TYPE = "מכתב_אחר"
+
+CLS_PROMPT = """
+אתה מסווג מסמכים משפטיים. החזר *מילה אחת בלבד* מתוך הרשימה:
+מכתב_פיטורין, חוזה, תקנון, תביעה, פסק_דין, מכתב_אחר
+
+• **מכתב_פיטורין** – הודעה על סיום העסקה (termination notice), כוללת תאריך סיום, פיצויי פיטורין, הודעה מוקדמת.
+• **תביעה** – כתב תביעה לבית-משפט, עם תובע/נתבע וסעד מבוקש.
+• **חוזה**  – הסכם בין צדדים עם סעיפים הדדיים.
+• **תקנון** – כללים/נהלים כלליים (לרוב פורמט PDF של חברה/עמותה).
+• **פסק_דין** – החלטה סופית של בית-משפט.
+• **מכתב_אחר** – כל מכתב רשמי שלא מתאים לקטגוריות לעיל.
+
+דוגמה:
+«הריני להודיעך על הפסקת עבודתך בחברה…» → מכתב_פיטורין
+«בית-הדין הנכבד מתבקש לחייב את הנתבע…» → תביעה
+
+הטקסט:
+"""
+KEYWORD_OVERRIDES = {
+    r"פיטור(ין|ים)|סיום העסק(ה|תך)|הודעה על סיום|חשבונ(ך|ו) ייערך|termination notice|פיטורים|שימוע": "מכתב_פיטורין",
+    r"כתב\s+תביעה|הנתבע|התובע": "תביעה",
+}
+# Compiled once, checked in order; the first match wins
+OVERRIDE_PATTERNS = [(re.compile(pattern, re.I), doc_type) for pattern, doc_type in KEYWORD_OVERRIDES.items()]
+
+
+def keyword_override(text):
+    """The document type forced by a keyword pattern, or None."""
+    for pattern, doc_type in OVERRIDE_PATTERNS:
+        if pattern.search(text):
+            return doc_type
+    return None
+
+
+def classify_with_model(client, text):
+    """Model classification of the document's opening and closing 800 characters; None on failure."""
+    sample = text[:800] + "\n\n---\n\n" + text[-800:]
+    try:
+        resp = client.chat.completions.create(
+            model=CLASSIFIER_MODEL,
+            messages=[{"role": "system", "content": CLS_PROMPT + sample}],
+            temperature=0.0,
+            max_tokens=5,
+        )
+        return resp.choices[0].message.content.strip()
+    except Exception:
+        return None
+
+
+def classify_document(client, text, doc_hash):
+    """Document type for `text`, cached under its content hash.
+
+    Model failures fall back to DEFAULT_DOC_TYPE and are not cached.
+    """
+    key = versioned_key(doc_hash, CLASSIFIER_VERSION, CLASSIFIER_MODEL)
+    cache = shared_cache("doc_classes", max_entries=20000)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached.decode("utf-8")
+    doc_type = keyword_override(text) or classify_with_model(client, text)
+    if doc_type is None:
+        return DEFAULT_DOC_TYPE
+    cache.set(key, doc_type)
+    return doc_type
+
+
+def classify_in_background(client, text, doc_hash):
+    """Future for `classify_document` on the background pool."""
+    return run_in_background(classify_document, client, text, doc_hash)
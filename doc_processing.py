@@ -0,0 +1,105 @@
+"""Text extraction for documents uploaded to the chat.
+
+PDF pages and DOCX paragraphs are read one at a time, stripped of English-only
+lines as they go, and extraction stops at DOC_MAX_PAGES pages or
+DOC_MAX_CHARS characters. Results are cached on disk by the file's content
+hash, so the same file is never parsed twice, and extraction runs on the
+background pool.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+
+import docx
+import fitz
+
+from background import run_in_background
+from cache_store import shared_cache
+
+DOC_MAX_PAGES = int(os.getenv("DOC_MAX_PAGES", "60"))
+DOC_MAX_CHARS = int(os.getenv("DOC_MAX_CHARS", "120000"))
+PDF_MIME_TYPE = "application/pdf"
+
+_HEBREW_LETTER = re.compile(r"[א-ת]")
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def strip_english_lines(text: str) -> str:
+    """Keep only lines with more than 6 Hebrew letters."""
+    return "\n".join(ln for ln in text.splitlines() if len(_HEBREW_LETTER.findall(ln)) > 6)
+
+
+def chunk_text(txt, max_len=450, max_chunks=None):
+    """Split text at sentence ends into chunks of about `max_len` characters (the first `max_chunks`)."""
+    sentences = re.split(r'(?:\.|\?|!)\s+', txt)
+    chunks, cur = [], ""
+    for s in sentences:
+        if len(cur) + len(s) > max_len and cur:
+            chunks.append(cur.strip())
+            cur = s
+        else:
+            cur += " " + s
+    if cur.strip():
+        chunks.append(cur.strip())
+    return chunks[:max_chunks] if max_chunks else chunks
+
+
+def _pdf_pages(data):
+    with fitz.open(stream=data, filetype="pdf") as pdf:
+        for page in pdf:
+            yield page.get_text()
+
+
+def _docx_pages(data):
+    # DOCX has no pages; each paragraph is one unit
+    for paragraph in docx.Document(io.BytesIO(data)).paragraphs:
+        yield paragraph.text
+
+
+def extract_text(data, mime_type, max_pages=DOC_MAX_PAGES, max_chars=DOC_MAX_CHARS):
+    """{"text", "pages", "truncated"} for an uploaded PDF/DOCX, within the page and character budgets.
+
+    `pages` counts PDF pages read (DOCX paragraphs are not limited by
+    `max_pages`).
+    """
+    is_pdf = mime_type == PDF_MIME_TYPE
+    units = _pdf_pages(data) if is_pdf else _docx_pages(data)
+    parts, length, pages, truncated = [], 0, 0, False
+    for text in units:
+        if is_pdf and pages >= max_pages:
+            truncated = True
+            break
+        pages += 1
+        clean = strip_english_lines(text)
+        if not clean:
+            continue
+        if length + len(clean) > max_chars:
+            parts.append(clean[:max(0, max_chars - length)])
+            truncated = True
+            break
+        parts.append(clean)
+        length += len(clean) + 1
+    units.close()
+    return {"text": "\n".join(parts), "pages": pages, "truncated": truncated}
+
+
+def cached_extract_text(data, mime_type, max_pages=DOC_MAX_PAGES, max_chars=DOC_MAX_CHARS):
+    """`extract_text`, cached by content hash and budgets."""
+    key = f"{content_hash(data)}:{max_pages}:{max_chars}"
+    cache = shared_cache("extracted_documents", max_entries=500)
+    cached = cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+    result = extract_text(data, mime_type, max_pages, max_chars)
+    cache.set(key, json.dumps(result, ensure_ascii=False))
+    return result
+
+
+def extract_in_background(data, mime_type, max_pages=DOC_MAX_PAGES, max_chars=DOC_MAX_CHARS):
+    """Future for `cached_extract_text` on the background pool."""
+    return run_in_background(cached_extract_text, data, mime_type, max_pages, max_chars)
@@ -0,0 +1,107 @@
+"""Map-reduce condensing of long documents before the final summary prompt.
+
+Documents longer than SUMMARY_CHUNK_CHARS are split into chunks at
+content-defined line boundaries, every chunk is summarized concurrently with
+the async OpenAI client, and the joined chunk summaries are reduced the same
+way until they fit in one prompt. Each chunk summary is cached by the chunk's
+hash; since boundaries depend only on nearby lines, re-summarizing an edited
+document only redoes the chunks around the edit.
+"""
+import asyncio
+import hashlib
+import os
+
+from cache_store import shared_cache, versioned_key
+from doc_processing import chunk_text
+
+SUMMARY_MODEL = "gpt-3.5-turbo"
+# Version of CHUNK_PROMPT in cache keys
+SUMMARY_PROMPT_VERSION = 1
+SUMMARY_CHUNK_CHARS = int(os.getenv("SUMMARY_CHUNK_CHARS", "6000"))
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+CHUNK_SUMMARY_MAX_TOKENS = 400
+# Reduce rounds before giving up and truncating
+MAX_REDUCE_LEVELS = 4
+# About one line in ANCHOR_EVERY ends a chunk, once the chunk is half full
+ANCHOR_EVERY = 16
+
+CHUNK_PROMPT = (
+    "סכם בעברית בלבד את הקטע הבא מתוך מסמך משפטי. "
+    "שמור את כל הצדדים, המועדים, הסכומים, ההתחייבויות, הסעיפים והסיכונים, ואל תוסיף מידע שאינו בקטע.\n—\n"
+)
+
+
+def chunk_summary_key(chunk, model):
+    digest = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+    return versioned_key(digest, SUMMARY_PROMPT_VERSION, model)
+
+
+def _is_anchor(line):
+    digest = hashlib.sha256(line.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % ANCHOR_EVERY == 0
+
+
+def content_chunks(text, max_chars=SUMMARY_CHUNK_CHARS):
+    """Split `text` into chunks of at most `max_chars`, at line boundaries chosen by content.
+
+    A chunk ends after an anchor line (by its hash) once it holds max_chars // 2
+    characters, or before a line that would overflow it. Lines longer than
+    `max_chars` are split at sentence ends first.
+    """
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if len(line) <= max_chars:
+            lines.extend([line] if line else [])
+            continue
+        for piece in chunk_text(line, max_len=max_chars):
+            lines.extend(piece[start:start + max_chars] for start in range(0, len(piece), max_chars))
+
+    chunks, current, size = [], [], 0
+    for line in lines:
+        if current and size + len(line) > max_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+        if size >= max_chars // 2 and _is_anchor(line):
+            chunks.append("\n".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+async def summarize_chunk(client, chunk, semaphore, model=SUMMARY_MODEL):
+    """Cached summary of one chunk; on failure the chunk's opening is used instead (and not cached)."""
+    cache = shared_cache("chunk_summaries", max_entries=20000)
+    key = chunk_summary_key(chunk, model)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached.decode("utf-8")
+    try:
+        async with semaphore:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": CHUNK_PROMPT + chunk + "\n—"}],
+                temperature=0.1,
+                max_tokens=CHUNK_SUMMARY_MAX_TOKENS,
+            )
+    except Exception:
+        return chunk[:SUMMARY_CHUNK_CHARS // 4]
+    summary = response.choices[0].message.content.strip()
+    cache.set(key, summary)
+    return summary
+
+
+async def condense_document(client, text, model=SUMMARY_MODEL, max_chars=SUMMARY_CHUNK_CHARS,
+                            max_concurrency=SUMMARY_MAX_CONCURRENCY):
+    """`text` itself if it fits in `max_chars`, otherwise its chunk summaries, reduced until they fit."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    for _ in range(MAX_REDUCE_LEVELS):
+        if len(text) <= max_chars:
+            return text
+        chunks = content_chunks(text, max_chars)
+        summaries = await asyncio.gather(*(summarize_chunk(client, chunk, semaphore, model) for chunk in chunks))
+        text = "\n\n".join(summaries)
+    return text[:max_chars]
@@ -0,0 +1,98 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+EMBEDDING_MODEL_NAME = "intfloat/multilingual-e5-large"
+# e5 is trained with these prefixes: indexed texts are passages, searches are queries
+PASSAGE_PREFIX = "passage: "
+QUERY_PREFIX = "query: "
+
+
+class EmbeddingService:
+    """Caching front for a SentenceTransformer model.
+
+    Embeddings are keyed by model name, normalization flag and the text's
+    sha256, and looked up in an LRU memory tier, then in an optional on-disk
+    tier (a `cache_store.SqliteCache` holding float32 blobs). Only misses reach
+    the model, in a single batched `encode` call. `encode` accepts the same
+    arguments the pages pass to `SentenceTransformer.encode`.
+    """
+
+    def __init__(self, model, model_name, memory_size=2048, disk_cache=None):
+        self.model = model
+        self.model_name = model_name
+        self.memory_size = memory_size
+        self.disk_cache = disk_cache
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, text, normalize_embeddings):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{int(normalize_embeddings)}:{digest}"
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+        if self.disk_cache is not None:
+            blob = self.disk_cache.get(key)
+            if blob is not None:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                self._remember(key, vector)
+                with self._lock:
+                    self.disk_hits += 1
+                return vector
+        return None
+
+    def encode(self, texts, normalize_embeddings=True, batch_size=32, **kwargs):
+        """Return a float32 array with one embedding row per text."""
+        keys = [self._key(text, normalize_embeddings) for text in texts]
+        vectors = [self._lookup(key) for key in keys]
+
+        missing = {}
+        for position, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[position], []).append(position)
+        if missing:
+            with self._lock:
+                self.misses += len(missing)
+            texts_to_encode = [texts[positions[0]] for positions in missing.values()]
+            encoded = np.asarray(self.model.encode(
+                texts_to_encode,
+                normalize_embeddings=normalize_embeddings,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                **kwargs,
+            ), dtype=np.float32)
+            for (key, positions), vector in zip(missing.items(), encoded):
+                self._remember(key, vector)
+                if self.disk_cache is not None:
+                    self.disk_cache.set(key, vector.tobytes())
+                for position in positions:
+                    vectors[position] = vector
+
+        if not vectors:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack(vectors)
+
+    def encode_queries(self, texts, **kwargs):
+        """`encode` for search texts, adding the e5 query prefix."""
+        return self.encode([QUERY_PREFIX + text for text in texts], **kwargs)
+
+    def stats(self):
+        return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses}
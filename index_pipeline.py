@@ -0,0 +1,254 @@
+"""Build or refresh the law/judgment vector indexes from Mongo.
+
+Usage:
+    python index_pipeline.py [laws-names judgments-names laws-sections] [--backend local|pinecone]
+                             [--incremental] [--restart] [--batch-size 500] ...
+
+Documents are streamed in _id order, embedded in large batches with the shared
+e5 model ("passage: " prefix) and upserted in chunks; laws-sections holds one
+vector per law section. Missing Pinecone indexes are created (serverless, cosine,
+PINECONE_CLOUD/PINECONE_REGION). Progress is checkpointed, so an interrupted run resumes
+where it stopped; the local backend stages each checkpoint in a shard file and
+rewrites its index files once, at the end of the run. With --incremental, documents whose embedded text hasn't
+changed since the last run are skipped.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from cache_store import CACHE_DIR, SqliteCache
+from embedding_service import EMBEDDING_MODEL_NAME
+from vector_store import INDEX_FIELDS, INDEX_SOURCES, LocalVectorIndex, document_records
+
+CHECKPOINT_DIR = os.path.join(CACHE_DIR, "index_pipeline")
+
+
+# ------------------------------------------------------------
+# Checkpoints
+# ------------------------------------------------------------
+def checkpoint_path(index_name, backend):
+    return os.path.join(CHECKPOINT_DIR, f"{backend}-{index_name}.json")
+
+
+def load_checkpoint(index_name, backend):
+    try:
+        with open(checkpoint_path(index_name, backend), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"last_id": None, "completed": True}
+
+
+def save_checkpoint(index_name, backend, state):
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    tmp = checkpoint_path(index_name, backend) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, checkpoint_path(index_name, backend))
+
+
+# ------------------------------------------------------------
+# Backends
+# ------------------------------------------------------------
+class PineconeWriter:
+    def __init__(self, index_name, dimension):
+        import pinecone
+        client = pinecone.Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        if index_name not in client.list_indexes().names():
+            # Serverless, in PINECONE_CLOUD / PINECONE_REGION (default aws / us-east-1)
+            cloud, region = os.getenv("PINECONE_CLOUD", "aws"), os.getenv("PINECONE_REGION", "us-east-1")
+            print(f"[{index_name}] creating index ({dimension} dims, cosine) in {cloud}/{region}")
+            client.create_index(name=index_name, dimension=dimension, metric="cosine",
+                                spec=pinecone.ServerlessSpec(cloud=cloud, region=region))
+        self.index = client.Index(index_name)
+
+    def upsert(self, records):
+        self.index.upsert(vectors=[{**r, "values": r["values"].tolist()} for r in records])
+
+    def commit(self, completed=False):
+        pass
+
+
+class LocalWriter:
+    """Stages each checkpoint's records in a shard file under CHECKPOINT_DIR.
+
+    A checkpoint only writes the records upserted since the previous one. The
+    index files (and the IVF lists) are rewritten once, when the run completes,
+    from all shards on disk, including those left by an interrupted run.
+    """
+
+    def __init__(self, index_name, ivf_lists=None):
+        self.index_name = index_name
+        self.ivf_lists = ivf_lists
+        self.shard_dir = os.path.join(CHECKPOINT_DIR, f"local-{index_name}-shards")
+        self._records = []
+
+    def _shard_path(self, shard, extension):
+        return os.path.join(self.shard_dir, f"{shard:06d}{extension}")
+
+    def _shards(self):
+        try:
+            names = os.listdir(self.shard_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-4]) for name in names if name.endswith(".npy") and name[:-4].isdigit())
+
+    def upsert(self, records):
+        self._records.extend(records)
+
+    def commit(self, completed=False):
+        if self._records:
+            self._write_shard()
+        if completed:
+            self._merge()
+
+    def _write_shard(self):
+        os.makedirs(self.shard_dir, exist_ok=True)
+        shards = self._shards()
+        shard = shards[-1] + 1 if shards else 0
+        # Metadata first: a shard counts once its .npy file exists
+        with open(self._shard_path(shard, ".json.tmp"), "w", encoding="utf-8") as f:
+            json.dump([{"id": r["id"], "metadata": r["metadata"]} for r in self._records], f,
+                      ensure_ascii=False, default=str)
+        os.replace(self._shard_path(shard, ".json.tmp"), self._shard_path(shard, ".json"))
+        np.save(self._shard_path(shard, ".tmp.npy"), np.vstack([r["values"] for r in self._records]).astype(np.float32))
+        os.replace(self._shard_path(shard, ".tmp.npy"), self._shard_path(shard, ".npy"))
+        self._records = []
+
+    def _merge(self):
+        shards = self._shards()
+        if not shards and not self.ivf_lists:
+            return
+        index = LocalVectorIndex(self.index_name)
+        # In shard order, so a later upsert of the same id wins
+        for shard in shards:
+            with open(self._shard_path(shard, ".json"), "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            vectors = np.load(self._shard_path(shard, ".npy"), mmap_mode="r")
+            index.upsert([{"id": entry["id"], "values": vector, "metadata": entry["metadata"]}
+                          for entry, vector in zip(entries, vectors)])
+        index.save(ivf_lists=self.ivf_lists)
+        del index
+        for shard in shards:
+            os.remove(self._shard_path(shard, ".npy"))
+            os.remove(self._shard_path(shard, ".json"))
+
+
+# ------------------------------------------------------------
+# Pipeline
+# ------------------------------------------------------------
+def run(index_name, db, model, writer, backend, batch_size=500, embed_batch_size=64,
+        upsert_batch_size=100, checkpoint_every=5000, incremental=False, restart=False):
+    collection_name, key_field = INDEX_SOURCES[index_name]
+    # doc key -> hash of the embedded text, as of the last run that indexed it
+    hashes = SqliteCache(f"index_hashes_{backend}_{index_name}", max_entries=10 ** 9)
+
+    state = load_checkpoint(index_name, backend)
+    if restart or state["completed"]:
+        state = {"last_id": None, "completed": False}
+    query = {"_id": {"$gt": ObjectId(state["last_id"])}} if state["last_id"] else {}
+    if state["last_id"]:
+        print(f"[{index_name}] resuming after _id {state['last_id']}")
+
+    cursor = (db[collection_name]
+              .find(query, {key_field: 1, **{field: 1 for field in INDEX_FIELDS[index_name]}})
+              .sort("_id", 1)
+              .batch_size(batch_size))
+
+    seen = embedded = since_checkpoint = 0
+    batch, pending_hashes, started = [], [], time.perf_counter()
+
+    def flush():
+        nonlocal embedded
+        records = [record for _, doc_records, _ in batch for record in doc_records]
+        if records:
+            vectors = model.encode([r["text"] for r in records], normalize_embeddings=True,
+                                   batch_size=embed_batch_size, convert_to_numpy=True)
+            records = [{"id": r["id"], "values": vector, "metadata": r["metadata"]}
+                       for r, vector in zip(records, vectors)]
+            for start in range(0, len(records), upsert_batch_size):
+                writer.upsert(records[start:start + upsert_batch_size])
+        pending_hashes.extend((key, text_hash) for key, _, text_hash in batch)
+        embedded += len(batch)
+        batch.clear()
+
+    def checkpoint(last_id, completed=False):
+        if batch:
+            flush()
+        writer.commit(completed)
+        # Only remember hashes once their vectors are committed
+        for key, text_hash in pending_hashes:
+            hashes.set(key, text_hash)
+        pending_hashes.clear()
+        state.update(last_id=str(last_id) if last_id else state["last_id"], completed=completed)
+        save_checkpoint(index_name, backend, state)
+
+    last_id = None
+    for doc in cursor:
+        last_id = doc["_id"]
+        seen += 1
+        since_checkpoint += 1
+        if doc.get(key_field) is not None:
+            key = str(doc[key_field])
+            doc_records = document_records(index_name, doc)
+            text = "\n".join(r["text"] for r in doc_records)
+            text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            cached = hashes.get(key)
+            if not (incremental and cached is not None and cached.decode("utf-8") == text_hash):
+                batch.append((key, doc_records, text_hash))
+                if len(batch) >= batch_size:
+                    flush()
+        if since_checkpoint >= checkpoint_every:
+            checkpoint(last_id)
+            since_checkpoint = 0
+            print(f"[{index_name}] {seen} scanned, {embedded} embedded "
+                  f"({time.perf_counter() - started:.0f}s)")
+
+    checkpoint(last_id, completed=True)
+    print(f"[{index_name}] done: {seen} scanned, {embedded} embedded "
+          f"in {time.perf_counter() - started:.0f}s")
+    return embedded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("indexes", nargs="*", default=list(INDEX_SOURCES),
+                        help=f"indexes to build (default: {' '.join(INDEX_SOURCES)})")
+    parser.add_argument("--backend", default=os.getenv("VECTOR_BACKEND", "pinecone"), choices=["pinecone", "local"])
+    parser.add_argument("--batch-size", type=int, default=500, help="Mongo cursor and embedding batch size")
+    parser.add_argument("--embed-batch-size", type=int, default=64, help="model forward-pass batch size")
+    parser.add_argument("--upsert-batch-size", type=int, default=100)
+    parser.add_argument("--checkpoint-every", type=int, default=5000, help="documents between checkpoints")
+    parser.add_argument("--incremental", action="store_true", help="skip documents whose text is unchanged")
+    parser.add_argument("--restart", action="store_true", help="ignore an unfinished checkpoint")
+    parser.add_argument("--ivf-lists", type=int, default=None, help="local backend: build an IVF index")
+    args = parser.parse_args()
+    unknown = set(args.indexes) - set(INDEX_SOURCES)
+    if unknown:
+        parser.error(f"unknown index: {', '.join(sorted(unknown))}")
+
+    load_dotenv()
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    db = MongoClient(os.getenv("MONGO_URI"))[os.getenv("DATABASE_NAME")]
+
+    for index_name in args.indexes:
+        writer = (LocalWriter(index_name, args.ivf_lists) if args.backend == "local"
+                  else PineconeWriter(index_name, model.get_sentence_embedding_dimension()))
+        run(index_name, db, model, writer, args.backend,
+            batch_size=args.batch_size,
+            embed_batch_size=args.embed_batch_size,
+            upsert_batch_size=args.upsert_batch_size,
+            checkpoint_every=args.checkpoint_every,
+            incremental=args.incremental,
+            restart=args.restart)
+
+
+if __name__ == "__main__":
+    main()
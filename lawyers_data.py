@@ -0,0 +1,184 @@
+"""Columnar cache of data/lawyers_with_case_info.csv.
+
+The CSV is converted once into an uncompressed Arrow IPC file under CACHE_DIR,
+with ProcedureType, CourtType and LawyerName dictionary-encoded (categoricals
+in pandas) and rows missing any of them dropped. Loads memory-map that file;
+the other text columns are stored as large_string and loaded as
+string[pyarrow], so they stay backed by the mapped buffers instead of being
+copied into Python objects. The file is rebuilt whenever the CSV's mtime (or
+ARROW_FORMAT_VERSION) no longer matches the tag recorded in its metadata.
+
+LawyerIndex groups that frame by lawyer once, so the per-lawyer profile is a
+slice lookup instead of a scan over every row, and TopLawyersCube does the same
+for the top-lawyers chart's ProcedureType x CourtType filters.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from cache_store import CACHE_DIR
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LAWYERS_CSV = os.path.join(PROJECT_ROOT, "data", "lawyers_with_case_info.csv")
+LAWYERS_ARROW = os.path.join(CACHE_DIR, "lawyers_with_case_info.arrow")
+CATEGORICAL_COLUMNS = ["ProcedureType", "CourtType", "LawyerName"]
+SOURCE_TAG_KEY = b"source_tag"
+# Bump when build_arrow changes the file layout, so older cache files are rebuilt
+ARROW_FORMAT_VERSION = 2
+# Filter value meaning "any"; also the dropdowns' first option
+ALL = "הכל"
+TOP_LAWYERS = 5
+
+
+def csv_mtime(csv_path=LAWYERS_CSV):
+    return os.path.getmtime(csv_path)
+
+
+def _source_tag(csv_path):
+    return f"{csv_mtime(csv_path)!r}:v{ARROW_FORMAT_VERSION}"
+
+
+def _string_dtype(arrow_type):
+    # pandas keeps large_string data as is; plain string would be cast (copied) on load
+    return pd.StringDtype("pyarrow") if pa.types.is_large_string(arrow_type) else None
+
+
+def _cached_tag(arrow_path):
+    try:
+        with pa.memory_map(arrow_path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    return metadata.get(SOURCE_TAG_KEY, b"").decode() or None
+
+
+def build_arrow(csv_path=LAWYERS_CSV, arrow_path=LAWYERS_ARROW):
+    """Convert the CSV into the columnar cache file."""
+    df = pd.read_csv(csv_path, dtype={column: "category" for column in CATEGORICAL_COLUMNS})
+    df = df.dropna(subset=CATEGORICAL_COLUMNS).reset_index(drop=True)
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = df[column].cat.remove_unused_categories()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    schema = pa.schema(
+        [field.with_type(pa.large_string()) if pa.types.is_string(field.type) else field for field in table.schema],
+        metadata={**(table.schema.metadata or {}), SOURCE_TAG_KEY: _source_tag(csv_path).encode()},
+    )
+    table = table.cast(schema)
+    os.makedirs(os.path.dirname(arrow_path), exist_ok=True)
+    tmp_path = arrow_path + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, arrow_path)
+
+
+def load_lawyers(csv_path=LAWYERS_CSV, arrow_path=LAWYERS_ARROW):
+    """The lawyers dataset as a DataFrame, read from the memory-mapped cache (rebuilt if stale).
+
+    The frame is meant to be shared read-only: filter it, don't modify it.
+    """
+    if _cached_tag(arrow_path) != _source_tag(csv_path):
+        build_arrow(csv_path, arrow_path)
+    with pa.memory_map(arrow_path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(types_mapper=_string_dtype)
+
+
+def _group_offsets(codes, groups):
+    """Start offsets of each group in rows sorted by group code (length groups + 1)."""
+    return np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=groups))])
+
+
+def split_case_names(case_names):
+    """Split "court, case name" strings into (court, case name) Series.
+
+    Names without a comma have no court; missing names stay missing in both.
+    """
+    parts = case_names.str.split(",", n=1, expand=True).reindex(columns=[0, 1])
+    first = parts[0].str.strip()
+    has_court = parts[1].notna()
+    return first.where(has_court), parts[1].str.strip().where(has_court, first)
+
+
+class LawyerIndex:
+    """Per-lawyer cases and ProcedureType / CourtType counts, precomputed from `load_lawyers()`.
+
+    Keeps the shared frame as is, plus the row order sorted by lawyer, group
+    offsets into it and CaseName pre-split into "בית משפט" / "שם תיק" (in that
+    order), so `profile` only takes one lawyer's rows.
+    """
+
+    HISTOGRAM_COLUMNS = ["ProcedureType", "CourtType"]
+
+    def __init__(self, df):
+        self.names = df["LawyerName"].cat.categories
+        self._codes = {name: code for code, name in enumerate(self.names)}
+        codes = df["LawyerName"].cat.codes.to_numpy()
+        self.df = df
+        self.order = np.argsort(codes, kind="stable")
+        self.offsets = _group_offsets(codes, len(self.names))
+        self.split_columns = {}
+        if "CaseName" in df.columns:
+            court, case_name = split_case_names(df["CaseName"].take(self.order))
+            self.split_columns = {"בית משפט": court.array, "שם תיק": case_name.array}
+        self.histograms = {column: self._histogram(codes, df[column]) for column in self.HISTOGRAM_COLUMNS}
+
+    def _histogram(self, codes, values):
+        """(counts, offsets): counts of `values` per lawyer, sorted by lawyer then descending count."""
+        counts = (
+            pd.DataFrame({"lawyer": codes, "value": values.to_numpy()})
+            .groupby(["lawyer", "value"], observed=True).size()
+            .reset_index(name="count")
+            .sort_values(["lawyer", "count"], ascending=[True, False], kind="stable")
+        )
+        return counts, _group_offsets(counts["lawyer"].to_numpy(), len(self.names))
+
+    def counts(self, code, column):
+        counts, offsets = self.histograms[column]
+        block = counts.iloc[offsets[code]:offsets[code + 1]]
+        return pd.Series(block["count"].to_numpy(), index=block["value"].to_numpy(), name="count")
+
+    def profile(self, lawyer_name):
+        """Cases and count histograms of one lawyer; None for an unknown name."""
+        code = self._codes.get(lawyer_name)
+        if code is None:
+            return None
+        start, end = self.offsets[code], self.offsets[code + 1]
+        cases = self.df.iloc[self.order[start:end]].assign(
+            **{column: values[start:end] for column, values in self.split_columns.items()})
+        return {
+            "cases": cases,
+            **{column: self.counts(code, column) for column in self.HISTOGRAM_COLUMNS},
+        }
+
+
+class TopLawyersCube:
+    """Case counts per (ProcedureType, CourtType, LawyerName), with ALL marginals and precomputed top lists.
+
+    Every filter combination, ALL included, maps to its `top_k` lawyers as a
+    ready DataFrame [LawyerName, Count], sorted by descending count (ties by
+    name), so `top_lawyers` is a dict lookup.
+    """
+
+    KEYS = ["ProcedureType", "CourtType"]
+
+    def __init__(self, df, top_k=TOP_LAWYERS):
+        counts = df.groupby(self.KEYS + ["LawyerName"], observed=True).size().reset_index(name="Count")
+        counts = counts.astype({column: object for column in self.KEYS + ["LawyerName"]})
+        levels = [counts]
+        for kept in (["ProcedureType"], ["CourtType"], []):
+            margin = counts.groupby(kept + ["LawyerName"])["Count"].sum().reset_index()
+            levels.append(margin.assign(**{column: ALL for column in self.KEYS if column not in kept}))
+        cube = pd.concat(levels, ignore_index=True).sort_values(
+            ["Count", "LawyerName"], ascending=[False, True], kind="stable")
+        self.counts = cube.set_index(self.KEYS + ["LawyerName"])["Count"]
+        self.top = {
+            key: group[["LawyerName", "Count"]].reset_index(drop=True)
+            for key, group in cube.groupby(self.KEYS, sort=False).head(top_k).groupby(self.KEYS, sort=False)
+        }
+        self._empty = pd.DataFrame({"LawyerName": pd.Series(dtype=object), "Count": pd.Series(dtype="int64")})
+
+    def top_lawyers(self, procedure=ALL, court=ALL):
+        """Top lawyers for the filters (ALL for either means any); empty when nothing matches."""
+        return self.top.get((procedure, court), self._empty)
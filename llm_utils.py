@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+
+from cache_store import shared_cache, versioned_key
+
+# ------------------------------------------------------------
+# Concurrency settings for per-result LLM calls
+# ------------------------------------------------------------
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "5"))
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "20"))  # seconds
+
+# Minimum seconds between placeholder redraws while an answer streams in
+STREAM_RENDER_INTERVAL = float(os.getenv("STREAM_RENDER_INTERVAL", "0.05"))
+
+# Persistent cache of LLM relevance explanations
+EXPLANATION_CACHE_TTL = float(os.getenv("EXPLANATION_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+EXPLANATION_CACHE_SIZE = int(os.getenv("EXPLANATION_CACHE_SIZE", "5000"))
+
+
+def map_concurrently(fn, items, max_workers=LLM_MAX_CONCURRENCY, timeout=LLM_CALL_TIMEOUT):
+    """Run fn(item) for every item on a bounded thread pool.
+
+    Yields (position, result) in completion order, so callers can render each
+    result as soon as it arrives. A call that raises, or that hasn't finished
+    once every wave of `max_workers` calls has had `timeout` seconds, is
+    yielded with result None instead of stalling the caller.
+    """
+    items = list(items)
+    if not items:
+        return
+    max_workers = max(1, min(max_workers, len(items)))
+    waves = -(-len(items) // max_workers)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(fn, item): position for position, item in enumerate(items)}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=timeout * waves):
+            pending.discard(future)
+            yield futures[future], None if future.exception() else future.result()
+    except FuturesTimeoutError:
+        for future in pending:
+            done = future.done() and not future.exception()
+            yield futures[future], future.result() if done else None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ------------------------------------------------------------
+# Explanation cache
+# ------------------------------------------------------------
+def get_explanation_cache():
+    return shared_cache("llm_explanations", ttl=EXPLANATION_CACHE_TTL, max_entries=EXPLANATION_CACHE_SIZE)
+
+
+def explanation_cache_key(scenario, doc_id, prompt_version, model):
+    """Content-addressed key: whitespace-normalized scenario hash + document + prompt + model."""
+    normalized = " ".join(scenario.split())
+    scenario_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    return versioned_key(f"{scenario_hash}:{doc_id}", prompt_version, model)
+
+
+def cached_explanation(key, compute):
+    """Return the cached JSON explanation for `key`, or compute and store it.
+
+    Results carrying an "error" are returned but not cached.
+    """
+    cache = get_explanation_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+    result = compute()
+    if not result.get("error"):
+        cache.set(key, json.dumps(result, ensure_ascii=False))
+    return result
+
+
+# ------------------------------------------------------------
+# Streaming chat completions
+# ------------------------------------------------------------
+class _StreamProgress:
+    """Accumulates streamed completion chunks, throttles redraws and times the stream."""
+
+    def __init__(self, started, on_text):
+        self.started = started
+        self.on_text = on_text
+        self.parts = []
+        self.timings = {}
+        self.last_render = 0.0
+
+    def feed(self, chunk):
+        text = chunk.choices[0].delta.content if chunk.choices else None
+        if not text:
+            return
+        now = time.perf_counter()
+        self.timings.setdefault("first_token", now - self.started)
+        self.parts.append(text)
+        if self.on_text and now - self.last_render >= STREAM_RENDER_INTERVAL:
+            self.on_text("".join(self.parts))
+            self.last_render = now
+
+    def finish(self):
+        text = "".join(self.parts).strip()
+        self.timings["total"] = time.perf_counter() - self.started
+        self.timings.setdefault("first_token", self.timings["total"])
+        return text, self.timings
+
+
+def stream_completion(stream, started, on_text=None):
+    """Consume a `stream=True` chat completion.
+
+    `on_text(text so far)` is called as tokens arrive, at most every
+    STREAM_RENDER_INTERVAL seconds; the caller renders the final text.
+    Returns (text, {"first_token", "total"}), in seconds since `started`,
+    the time.perf_counter() taken before the request was sent.
+    """
+    progress = _StreamProgress(started, on_text)
+    for chunk in stream:
+        progress.feed(chunk)
+    return progress.finish()
+
+
+async def astream_completion(stream, started, on_text=None):
+    """`stream_completion` for the async OpenAI client."""
+    progress = _StreamProgress(started, on_text)
+    async for chunk in stream:
+        progress.feed(chunk)
+    return progress.finish()
@@ -0,0 +1,21 @@
+import asyncio
+
+
+def fetch_by_keys(collection, key_field, keys, projection=None):
+    """Fetch the documents whose `key_field` is in `keys` with one `$in` query.
+
+    Returns {key: document} in the order of `keys` (e.g. the Pinecone ranking).
+    Missing keys are left out and repeated keys are fetched once.
+    """
+    keys = list(dict.fromkeys(key for key in keys if key is not None))
+    if not keys:
+        return {}
+    found = {}
+    for doc in collection.find({key_field: {"$in": keys}}, projection):
+        found.setdefault(doc.get(key_field), doc)
+    return {key: found[key] for key in keys if key in found}
+
+
+async def afetch_by_keys(collection, key_field, keys, projection=None):
+    """`fetch_by_keys` on a worker thread, so the blocking driver call doesn't stall the event loop."""
+    return await asyncio.to_thread(fetch_by_keys, collection, key_field, keys, projection)
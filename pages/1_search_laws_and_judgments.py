@@ -1,8 +1,12 @@
 import streamlit as st
 from app_resources import mongo_client
+from text_search import TextIndex
 from dotenv import load_dotenv
 import os
+import json
+import threading
 from datetime import datetime
+from cachetools import TTLCache
 from streamlit_option_menu import option_menu
 
 # Load environment variables
@@ -12,6 +16,23 @@ load_dotenv()
 MONGO_URI = os.getenv('MONGO_URI')
 DATABASE_NAME = os.getenv('DATABASE_NAME')
 
+# Pagination
+PAGE_SIZE = 10
+# Keyset mode records a checkpoint at least every CHECKPOINT_EVERY pages, so a
+# jump only ever seeks forward from the nearest one instead of from page 1.
+CHECKPOINT_EVERY = 10
+
+# Result counts
+COUNT_CACHE_TTL = 300  # seconds
+COUNT_CACHE_SIZE = 256
+# Approximate mode stops counting past this many matches ("10,000+")
+APPROX_COUNT_CAP = 10000
+# Ranked text-search ids checked against the other filters per Mongo query
+TEXT_FILTER_BATCH = 1000
+
+# Full-text search index is rebuilt from Mongo after this many seconds
+TEXT_INDEX_TTL = 3600
+
 # Custom CSS for Styling
 st.markdown("""
 <style>
@@ -98,37 +119,130 @@ def is_expanded(key):
     return st.session_state.get(key, False)
 
 
+def filters_key(filters):
+    """Stable string form of a Mongo filter dict (dates included)."""
+    return json.dumps(filters or {}, sort_keys=True, default=str, ensure_ascii=False)
+
+
+def cursor_of(doc, sort_key):
+    return (doc.get(sort_key), doc["_id"])
+
+
+def seek_pipeline(sort_key, filters=None, skip=0, limit=10, after=None, before=None):
+    """Build a pipeline sorted on (sort_key, _id).
+
+    With `after` / `before` (a (sort_key value, _id) cursor) the page starts
+    right after / ends right before that document, so Mongo seeks through the
+    index instead of walking and discarding every earlier document. `before`
+    sorts descending; the caller reverses the result.
+
+    Null or missing keys sort before every other value, but comparison
+    operators never match null, so they get their own branch of the seek.
+    """
+    match = dict(filters) if filters else {}
+    cursor = after if after is not None else before
+    if cursor is not None:
+        op = "$gt" if after is not None else "$lt"
+        key_value, doc_id = cursor
+        if key_value is None:
+            # Null keys come first: every non-null key is after the cursor, none is before it
+            seek = {"$or": [
+                {sort_key: None, "_id": {op: doc_id}},
+                *([{sort_key: {"$ne": None}}] if after is not None else []),
+            ]}
+        else:
+            seek = {"$or": [
+                {sort_key: {op: key_value}},
+                {sort_key: key_value, "_id": {op: doc_id}},
+                *([{sort_key: None}] if before is not None else []),
+            ]}
+        match = {"$and": [match, seek]} if match else seek
+    direction = -1 if before is not None else 1
+
+    pipeline = []
+    if match:
+        pipeline.append({"$match": match})
+    pipeline.append({"$sort": {sort_key: direction, "_id": direction}})
+    if skip:
+        pipeline.append({"$skip": skip})
+    pipeline.append({"$limit": limit})
+    return pipeline
+
+
+@st.cache_resource
+def get_count_cache():
+    """Process-wide (TTL, LRU-bounded) cache of result counts, with its lock."""
+    return TTLCache(maxsize=COUNT_CACHE_SIZE, ttl=COUNT_CACHE_TTL), threading.Lock()
+
+
+def cached_count(collection, filters=None, approximate=False):
+    """Count documents matching `filters`, memoised per normalised filter.
+
+    Returns (total, capped). In approximate mode the count stops at
+    APPROX_COUNT_CAP + 1, so a broad regex filter doesn't have to scan the
+    whole collection, and `capped` tells that the limit was hit; an exact count
+    already in the cache is reused for approximate requests.
+    """
+    cache, lock = get_count_cache()
+    exact_key = (collection.name, filters_key(filters), False)
+    approx_key = (collection.name, filters_key(filters), True)
+    with lock:
+        if exact_key in cache:
+            return cache[exact_key], False
+        if approximate and approx_key in cache:
+            return cache[approx_key], cache[approx_key] > APPROX_COUNT_CAP
+
+    if not filters:
+        total, key = collection.estimated_document_count(), exact_key
+    elif approximate:
+        total, key = collection.count_documents(filters, limit=APPROX_COUNT_CAP + 1), approx_key
+    else:
+        total, key = collection.count_documents(filters), exact_key
+
+    with lock:
+        cache[key] = total
+    return total, key == approx_key and total > APPROX_COUNT_CAP
+
+
+def count_label(total_items, capped=False):
+    """`capped` marks `total_items` as a lower bound (at most APPROX_COUNT_CAP is shown)."""
+    return f"{min(total_items, APPROX_COUNT_CAP):,}+" if capped else f"{total_items:,}"
+
+
+@st.cache_resource
+def ensure_pagination_indexes(_client):
+    try:
+        db = _client[DATABASE_NAME]
+        db["laws"].create_index([("IsraelLawID", 1), ("_id", 1)])
+        db["judgments"].create_index([("CaseNumber", 1), ("_id", 1)])
+    except Exception as e:
+        st.warning(f"Could not create pagination indexes: {str(e)}")
+
+
 # Functions for Laws
 
 
-def query_laws(client, filters=None, skip=0, limit=10):
+def query_laws(client, filters=None, skip=0, limit=10, after=None, before=None):
     try:
         db = client[DATABASE_NAME]
         collection = db["laws"]
-        pipeline = []
-        if filters:
-            pipeline.append({"$match": filters})
-        pipeline.append({"$sort": {"IsraelLawID": 1}})
-        pipeline.append({"$skip": skip})
-        pipeline.append({"$limit": limit})
+        pipeline = seek_pipeline("IsraelLawID", filters, skip, limit, after, before)
         pipeline.append({"$project": {"Segments": 0}})
         laws = list(collection.aggregate(pipeline))
-        return laws
+        return laws[::-1] if before is not None else laws
     except Exception as e:
         st.error(f"Error querying laws: {str(e)}")
         return []
 
 
-def count_laws(client, filters=None):
+def count_laws(client, filters=None, approximate=False):
     try:
         db = client[DATABASE_NAME]
         collection = db["laws"]
-        if filters:
-            return collection.count_documents(filters)
-        return collection.estimated_document_count()
+        return cached_count(collection, filters, approximate)
     except Exception as e:
         st.error(f"Error counting laws: {str(e)}")
-        return 0
+        return 0, False
 
 
 def load_full_law_details(client, law_id):
@@ -154,39 +268,164 @@ def get_procedure_types(client):
         return []
 
 
-def query_judgments(client, filters=None, skip=0, limit=10):
+def query_judgments(client, filters=None, skip=0, limit=10, after=None, before=None):
     try:
         db = client[DATABASE_NAME]
         collection = db["judgments"]
-        pipeline = []
-        if filters:
-            pipeline.append({"$match": filters})
-        pipeline.append({"$sort": {"CaseNumber": 1}})
-        pipeline.append({"$skip": skip})
-        pipeline.append({"$limit": limit})
+        pipeline = seek_pipeline("CaseNumber", filters, skip, limit, after, before)
         judgments = list(collection.aggregate(pipeline))
-        return judgments
+        return judgments[::-1] if before is not None else judgments
     except Exception as e:
         st.error(f"Error querying judgments: {str(e)}")
         return []
 
 
-def count_judgments(client, filters=None):
+def count_judgments(client, filters=None, approximate=False):
     try:
         db = client[DATABASE_NAME]
         collection = db["judgments"]
-        if filters:
-            return collection.count_documents(filters)
-        return collection.estimated_document_count()
+        return cached_count(collection, filters, approximate)
     except Exception as e:
         st.error(f"Error counting judgments: {str(e)}")
-        return 0
+        return 0, False
+
+
+# Keyset (cursor) pagination
+
+KEYSET_SOURCES = {
+    "Laws": ("laws", "IsraelLawID", query_laws),
+    "Judgments": ("judgments", "CaseNumber", query_judgments),
+}
+
+
+def get_keyset_state(search_type, filters):
+    """Cursor state for the current search, reset whenever the filters change.
+
+    `checkpoints` maps a page number to the cursor of the last document before
+    it (None for page 1); `prev` / `next` are the cursors of the first / last
+    document on the page shown last.
+    """
+    signature = f"{search_type}:{filters_key(filters)}"
+    state = st.session_state.get("keyset")
+    if not state or state["signature"] != signature:
+        state = {"signature": signature, "checkpoints": {1: None},
+                 "page": None, "prev": None, "next": None}
+        st.session_state["keyset"] = state
+    return state
+
+
+def find_cursor(client, search_type, filters, after, offset):
+    """Cursor of the document `offset` positions past `after` (keys only)."""
+    collection_name, sort_key, _ = KEYSET_SOURCES[search_type]
+    try:
+        pipeline = seek_pipeline(sort_key, filters, offset - 1, 1, after=after)
+        pipeline.append({"$project": {sort_key: 1}})
+        docs = list(client[DATABASE_NAME][collection_name].aggregate(pipeline))
+        return cursor_of(docs[0], sort_key) if docs else None
+    except Exception as e:
+        st.error(f"Error seeking {search_type.lower()} page: {str(e)}")
+        return None
+
+
+def query_keyset_page(client, search_type, filters, page):
+    _, sort_key, query_fn = KEYSET_SOURCES[search_type]
+    state = get_keyset_state(search_type, filters)
+    checkpoints = state["checkpoints"]
+
+    if page not in checkpoints and page == (state["page"] or 0) - 1 and state["prev"]:
+        docs = query_fn(client, filters, limit=PAGE_SIZE, before=state["prev"])
+    else:
+        # Seek forward from the nearest checkpoint, at most CHECKPOINT_EVERY
+        # pages per hop, recording each hop as a new checkpoint.
+        start = max(p for p in checkpoints if p <= page)
+        while start < page:
+            step = min(CHECKPOINT_EVERY, page - start)
+            cursor = find_cursor(client, search_type, filters,
+                                 checkpoints[start], step * PAGE_SIZE)
+            if cursor is None:
+                return []
+            start += step
+            checkpoints[start] = cursor
+        docs = query_fn(client, filters, limit=PAGE_SIZE, after=checkpoints[page])
+
+    if docs:
+        state["prev"] = cursor_of(docs[0], sort_key)
+        state["next"] = cursor_of(docs[-1], sort_key)
+        if len(docs) == PAGE_SIZE:
+            checkpoints[page + 1] = state["next"]
+    state["page"] = page
+    return docs
+
+
+def query_page(client, search_type, filters, page, use_keyset):
+    if use_keyset:
+        return query_keyset_page(client, search_type, filters, page)
+    _, _, query_fn = KEYSET_SOURCES[search_type]
+    return query_fn(client, filters, (page - 1) * PAGE_SIZE, PAGE_SIZE)
+
+
+# Full-text search
+
+@st.cache_resource(ttl=TEXT_INDEX_TTL, show_spinner="Building search index...")
+def load_text_index(_client, collection_name):
+    return TextIndex.from_collection(_client[DATABASE_NAME][collection_name])
+
+
+def filter_ranked_ids(collection, ranked_ids, filters, needed):
+    """The ids in `ranked_ids` that match `filters`, in rank order, checked TEXT_FILTER_BATCH at a time.
+
+    Stops once `needed` ids are found; returns (ids, exhausted), where
+    `exhausted` tells that every ranked id was checked.
+    """
+    allowed = []
+    for start in range(0, len(ranked_ids), TEXT_FILTER_BATCH):
+        batch = ranked_ids[start:start + TEXT_FILTER_BATCH]
+        matching = set(collection.distinct("_id", {"$and": [filters, {"_id": {"$in": batch}}]}))
+        allowed.extend(doc_id for doc_id in batch if doc_id in matching)
+        if len(allowed) >= needed:
+            return allowed, start + TEXT_FILTER_BATCH >= len(ranked_ids)
+    return allowed, True
+
+
+def query_text_page(client, search_type, text, filters, page):
+    """Rank by full-text relevance over Name/Description, then apply the other filters.
+
+    Returns (documents on `page`, total number of matches, capped). With other
+    filters, ranked ids are checked in batches only until `page` (plus one more
+    match) is filled; the total is then a lower bound and `capped` is True.
+    """
+    collection_name, _, _ = KEYSET_SOURCES[search_type]
+    try:
+        collection = client[DATABASE_NAME][collection_name]
+        index = load_text_index(client, collection_name)
+        ranked_ids = [doc_id for doc_id, _ in index.search(text)]
+        capped = False
+        if filters and ranked_ids:
+            ranked_ids, exhausted = filter_ranked_ids(collection, ranked_ids, filters, page * PAGE_SIZE + 1)
+            capped = not exhausted
+
+        page_ids = ranked_ids[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+        projection = {"Segments": 0} if collection_name == "laws" else None
+        docs = {doc["_id"]: doc
+                for doc in collection.find({"_id": {"$in": page_ids}}, projection)}
+        return [docs[doc_id] for doc_id in page_ids if doc_id in docs], len(ranked_ids), capped
+    except Exception as e:
+        st.error(f"Error searching {search_type.lower()}: {str(e)}")
+        return [], 0, False
 
 
 def reset_page():
     st.session_state["page"] = 1
 
 
+def go_to_page(page):
+    st.session_state["page"] = page
+
+
+def jump_to_page():
+    st.session_state["page"] = st.session_state["jump_page"]
+
+
 def main():
     st.title("📜 Legal Search")
 
@@ -232,6 +471,24 @@ def main():
         st.session_state["page"] = 1
 
     client = mongo_client
+    ensure_pagination_indexes(client)
+
+    use_keyset = st.checkbox(
+        "Cursor pagination (constant cost for deep pages)",
+        value=True,
+        key="keyset_pagination"
+    )
+    approximate_count = st.checkbox(
+        f"Approximate result counts (stop at {APPROX_COUNT_CAP:,})",
+        value=False,
+        key="approximate_count"
+    )
+    use_text_search = st.checkbox(
+        "Ranked full-text search for Name (Name and Description, Hebrew-aware)",
+        value=True,
+        key="text_search",
+        on_change=reset_page
+    )
 
     if search_type == "Laws":
         
@@ -246,7 +503,7 @@ def main():
                 on_change=reset_page
             )
             law_name = st.text_input(
-                "Filter by Name (Regex)",
+                "Filter by Name",
                 key="law_name_filter",
                 on_change=reset_page
             )
@@ -261,7 +518,7 @@ def main():
         filters = {}
         if israel_law_id > 0:
             filters["IsraelLawID"] = israel_law_id
-        if law_name:
+        if law_name and not use_text_search:
             filters["Name"] = {"$regex": law_name, "$options": "i"}
         if isinstance(date_range, tuple) and len(date_range) == 2:
             start_date, end_date = date_range
@@ -272,13 +529,17 @@ def main():
 
         # Query laws
         with st.spinner("Loading laws..."):
-            laws = query_laws(
-                client, filters, (st.session_state["page"] - 1) * 10, 10)
-            total_items = count_laws(client, filters)
+            if use_text_search and law_name:
+                laws, total_items, count_capped = query_text_page(
+                    client, "Laws", law_name, filters, st.session_state["page"])
+            else:
+                laws = query_page(
+                    client, "Laws", filters, st.session_state["page"], use_keyset)
+                total_items, count_capped = count_laws(client, filters, approximate_count)
 
             if laws:
                 st.markdown(
-                    f"### Page {st.session_state['page']} (Showing {len(laws)} of {total_items} laws)")
+                    f"### Page {st.session_state['page']} (Showing {len(laws)} of {count_label(total_items, count_capped)} laws)")
                 for law in laws:
                     law_description = law.get(
                         "Description", "").strip() or "אין תיאור לחוק זה"
@@ -340,7 +601,7 @@ def main():
                 on_change=reset_page
             )
             judgments_name = st.text_input(
-                "Filter by Name (Regex)",
+                "Filter by Name",
                 key="judgments_name_filter",
                 on_change=reset_page
             )
@@ -368,7 +629,7 @@ def main():
 
         if case_number:
             filters["CaseNumber"] = {"$regex": case_number, "$options": "i"}
-        if judgments_name:
+        if judgments_name and not use_text_search:
             filters["Name"] = {"$regex": judgments_name, "$options": "i"}
         if procedure_type != "All":
             filters["ProcedureType"] = procedure_type
@@ -382,14 +643,17 @@ def main():
 
         # Initial load trigger
         with st.spinner("Loading Judgments..."):
-            judgments = query_judgments(
-                client, filters, (st.session_state["page"] - 1) * 10, 10
-            )
-            total_items = count_judgments(client, filters)
+            if use_text_search and judgments_name:
+                judgments, total_items, count_capped = query_text_page(
+                    client, "Judgments", judgments_name, filters, st.session_state["page"])
+            else:
+                judgments = query_page(
+                    client, "Judgments", filters, st.session_state["page"], use_keyset)
+                total_items, count_capped = count_judgments(client, filters, approximate_count)
 
         if judgments:
             st.markdown(
-                f"### Page {st.session_state['page']} (Showing {len(judgments)} of {total_items} judgments)")
+                f"### Page {st.session_state['page']} (Showing {len(judgments)} of {count_label(total_items, count_capped)} judgments)")
             for judgment in judgments:
                 judgment_description = judgment.get(
                     "Description", "").strip() or "אין תיאור לפסק הדין זה"
@@ -443,16 +707,29 @@ def main():
 
     # Pagination controls
     if total_items > 0:
-        total_pages = (total_items + 9) // 10
+        # A lower-bound count (approximate count or partly filtered text search) leaves the last page open-ended
+        capped = count_capped
+        counted = min(total_items, APPROX_COUNT_CAP) if capped else total_items
+        total_pages = (counted + PAGE_SIZE - 1) // PAGE_SIZE
+        page = st.session_state["page"]
         col1, col2, col3 = st.columns(3)
         with col1:
-            if st.button("Previous Page") and st.session_state["page"] > 1:
-                st.session_state["page"] -= 1
+            st.button("Previous Page", on_click=go_to_page, args=(page - 1,),
+                      disabled=page <= 1)
         with col2:
-            st.write(f"Page {st.session_state['page']} of {total_pages}")
+            st.write(f"Page {page} of {total_pages:,}{'+' if capped else ''}")
+            st.number_input(
+                "Go to page",
+                min_value=1,
+                max_value=None if capped else max(total_pages, 1),
+                value=page if capped else min(page, max(total_pages, 1)),
+                step=1,
+                key="jump_page",
+                on_change=jump_to_page
+            )
         with col3:
-            if st.button("Next Page") and st.session_state["page"] < total_pages:
-                st.session_state["page"] += 1
+            st.button("Next Page", on_click=go_to_page, args=(page + 1,),
+                      disabled=page >= total_pages and not capped)
     else:
         st.warning(f"No {search_type.lower()} found with the applied filters.")
 
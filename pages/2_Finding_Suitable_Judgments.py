@@ -8,7 +8,11 @@ import torch
 # Fix for torch.classes error
 torch.classes.__path__ = []
 
-from app_resources import model, mongo_client, pinecone_client
+from app_resources import embedder, mongo_client, get_vector_index, load_reranker
+from mongo_lookup import fetch_by_keys
+from reranker import RERANK_CANDIDATES, rerank_results
+from llm_utils import (LLM_CALL_TIMEOUT, cached_explanation, explanation_cache_key,
+                       get_explanation_cache, map_concurrently)
 from openai import OpenAI
 import json
 
@@ -20,13 +24,21 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 # Constants
 INDEX_NAME = "judgments-names"
 COLLECTION_NAME = "judgments"
+# Only what a result card renders; the full document is loaded on demand
+CARD_PROJECTION = {"CaseNumber": 1, "Name": 1, "Description": 1, "DecisionDate": 1, "ProcedureType": 1}
+RESULTS_SHOWN = 5
 OPENAI_API_KEY = os.getenv("OPEN_AI")
+EXPLANATION_MODEL = "gpt-3.5-turbo"
+# Version of the explanation prompt in cache keys (see cache_store.versioned_key)
+EXPLANATION_PROMPT_VERSION = 1
 
 # OpenAI Client
 openai_client = OpenAI(api_key=OPENAI_API_KEY)
 
-# Pinecone Index
-index = pinecone_client.Index(INDEX_NAME)
+# Vector index (Pinecone or local, see app_resources.VECTOR_BACKEND)
+index = get_vector_index(INDEX_NAME)
+# Cross-encoder for reranking matches (None when RERANKER=0)
+reranker = load_reranker()
 
 # MongoDB Collection
 db = mongo_client[os.getenv("DATABASE_NAME")]
@@ -103,6 +115,19 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+def toggle_expansion(key):
+    st.session_state[key] = not st.session_state.get(key, False)
+
+
+# === Load the card fields for all matches in one query ===
+def load_judgment_cards(case_numbers):
+    try:
+        return fetch_by_keys(collection, "CaseNumber", case_numbers, CARD_PROJECTION)
+    except Exception as e:
+        st.error(f"Error fetching judgments: {str(e)}")
+        return {}
+
+
 # === Load full details for a single judgment ===
 def load_full_judgment_details(case_number):
     try:
@@ -112,8 +137,11 @@ def load_full_judgment_details(case_number):
         return None
 
 
+FALLBACK_EXPLANATION = {"advice": "לא ניתן לקבל הסבר בשלב זה.", "score": "N/A"}
+
+
 # === Get GPT Explanation for Why the Judgment Helps ===
-def get_judgment_explanation(scenario, judgment_doc):
+def request_judgment_explanation(scenario, judgment_doc):
     judgment_name = judgment_doc.get("Name", "")
     judgment_desc = judgment_doc.get("Description", "")
     prompt = f"""בהתבסס על הסצנריו הבא:
@@ -133,66 +161,142 @@ def get_judgment_explanation(scenario, judgment_doc):
 """
     try:
         response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model=EXPLANATION_MODEL,
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
+            temperature=0.7,
+            timeout=LLM_CALL_TIMEOUT
         )
         output = response.choices[0].message.content.strip()
         return json.loads(output)
     except Exception as e:
-        st.error(f"Error getting judgment explanation: {e}")
-        return {"advice": "לא ניתן לקבל הסבר בשלב זה.", "score": "N/A"}
+        # Runs on a worker thread, so the error is rendered by the caller
+        return {**FALLBACK_EXPLANATION, "error": f"Error getting judgment explanation: {e}"}
+
+
+def get_judgment_explanation(scenario, judgment_doc):
+    key = explanation_cache_key(scenario, judgment_doc.get("CaseNumber"), EXPLANATION_PROMPT_VERSION, EXPLANATION_MODEL)
+    return cached_explanation(key, lambda: request_judgment_explanation(scenario, judgment_doc))
+
+
+def load_advice(scenario, result):
+    result["explanation"] = get_judgment_explanation(scenario, result["doc"])
+
+
+# === Rerank the vector-search candidates with the cross-encoder ===
+def rank_judgments(scenario, matches):
+    if reranker is None:
+        return matches[:RESULTS_SHOWN]
+    found = [m for m in matches if m["doc"]]
+    try:
+        return rerank_results(
+            reranker, scenario, found,
+            lambda m: f"{m['doc'].get('Name', '')}\n{m['doc'].get('Description', '')}",
+            RESULTS_SHOWN,
+        )
+    except Exception as e:
+        st.warning(f"Reranking failed, showing vector-search order: {str(e)}")
+        return matches[:RESULTS_SHOWN]
+
+
+def render_explanation(placeholder, explanation):
+    advice = explanation.get("advice", "")
+    score = explanation.get("score", "N/A")
+    with placeholder.container():
+        if explanation.get("error"):
+            st.error(explanation["error"])
+        st.markdown(f"""
+            <div style="display: flex; justify-content: space-between; align-items: center;">
+                <span style="color: red;">עצת האתר: {advice}</span>
+                <span style="font-size: 24px; font-weight: bold; color: red;">{score}/10</span>
+            </div>
+        """, unsafe_allow_html=True)
 
 
 # === Main Interface ===
 st.title("Finding Suitable Judgments")
 scenario = st.text_area("Describe your scenario (what you plan to do, your situation, etc.):")
+eager_advice = st.checkbox("Get site advice for every result (slower)", value=False)
 
 if st.button("Find Suitable Judgments") and scenario:
     with st.spinner("Generating query embedding..."):
-        query_embedding = model.encode([scenario], normalize_embeddings=True)[0]
+        query_embedding = embedder.encode_queries([scenario], normalize_embeddings=True)[0]
     with st.spinner("Querying Pinecone for similar judgments..."):
         query_response = index.query(
             vector=query_embedding.tolist(),
-            top_k=5,
+            top_k=RERANK_CANDIDATES if reranker is not None else RESULTS_SHOWN,
             include_metadata=True
         )
 
-    if query_response and query_response.get("matches"):
+    matches = query_response.get("matches", []) if query_response else []
+    case_numbers = list(dict.fromkeys(
+        m.get("metadata", {}).get("CaseNumber") for m in matches
+        if m.get("metadata", {}).get("CaseNumber") is not None
+    ))
+    judgment_docs = load_judgment_cards(case_numbers)
+    with st.spinner("Ranking judgments..."):
+        ranked = rank_judgments(scenario, [{"case_number": c, "doc": judgment_docs.get(c)} for c in case_numbers])
+    st.session_state["judgment_results"] = {"scenario": scenario, "matches": ranked}
+
+results = st.session_state.get("judgment_results")
+if results:
+    if results["matches"]:
         st.markdown("### Suitable Judgments Found:")
-        for match in query_response["matches"]:
-            metadata = match.get("metadata", {})
-            case_number = metadata.get("CaseNumber")
-            if case_number is None:
-                continue
-            judgment_doc = load_full_judgment_details(case_number)
+        pending = []
+        for result in results["matches"]:
+            case_number = result["case_number"]
+            judgment_doc = result["doc"]
             if judgment_doc:
                 name = judgment_doc.get("Name", "No Name")
                 description = judgment_doc.get("Description", "אין תיאור לפסק הדין זה")
                 decision_date = judgment_doc.get("DecisionDate", "N/A")
                 procedure_type = judgment_doc.get("ProcedureType", "N/A")
+                relevance_html = (f'<div class="law-meta">Relevance: {result["relevance"]}/10</div>'
+                                  if "relevance" in result else "")
                 st.markdown(f"""
                     <div class="law-card">
                         <div class="law-title">{name} (ID: {case_number})</div>
                         <div class="law-description">{description}</div>
                         <div class="law-meta">Decision Date: {decision_date}</div>
                         <div class="law-meta">Procedure Type: {procedure_type}</div>
+                        {relevance_html}
                     </div>
                 """, unsafe_allow_html=True)
-                with st.spinner("Getting site advice..."):
-                    result = get_judgment_explanation(scenario, judgment_doc)
-                    advice = result.get("advice", "")
-                    score = result.get("score", "N/A")
-                st.markdown(f"""
-                    <div style="display: flex; justify-content: space-between; align-items: center;">
-                        <span style="color: red;">עצת האתר: {advice}</span>
-                        <span style="font-size: 24px; font-weight: bold; color: red;">{score}/10</span>
-                    </div>
-                """, unsafe_allow_html=True)
-                if st.button(f"View Full Details for {case_number}", key=f"details_{case_number}"):
+                # GPT advice is generated on demand, or for every card when eager_advice is set
+                placeholder = st.empty()
+                if "explanation" in result:
+                    render_explanation(placeholder, result["explanation"])
+                elif eager_advice:
+                    placeholder.markdown("⏳ Getting site advice...")
+                    pending.append((result, placeholder))
+                else:
+                    placeholder.button("💡 Get site advice", key=f"advice_{case_number}",
+                                       on_click=load_advice, args=(results["scenario"], result))
+                state_key = f"details_expanded_{case_number}"
+                st.button(
+                    f"View Full Details for {case_number}" if not st.session_state.get(state_key, False)
+                    else f"Hide Full Details for {case_number}",
+                    key=f"details_{case_number}",
+                    on_click=toggle_expansion,
+                    args=(state_key,)
+                )
+                if st.session_state.get(state_key, False):
                     with st.spinner("Loading full details..."):
-                        st.json(judgment_doc)
+                        full_doc = load_full_judgment_details(case_number)
+                    if full_doc:
+                        st.json(full_doc)
             else:
                 st.warning(f"No document found for CaseNumber: {case_number}")
+
+        # With eager_advice, explain every pending match in parallel and render each as it arrives
+        for position, explanation in map_concurrently(
+                lambda item: get_judgment_explanation(results["scenario"], item[0]["doc"]), pending):
+            result, placeholder = pending[position]
+            result["explanation"] = explanation or {
+                **FALLBACK_EXPLANATION, "error": "Timed out getting site advice."}
+            render_explanation(placeholder, result["explanation"])
+
+        cache_stats = get_explanation_cache().stats()
+        st.caption(f"Advice cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                   f"{cache_stats['entries']} stored")
     else:
         st.info("No similar judgments found.")
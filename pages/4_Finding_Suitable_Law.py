@@ -6,7 +6,12 @@ import torch
 
 torch.classes.__path__ = []
 
-from app_resources import model, pinecone_client, mongo_client
+from app_resources import embedder, get_law_section_index, get_vector_index, mongo_client, load_reranker
+from mongo_lookup import fetch_by_keys
+from reranker import RERANK_CANDIDATES, rerank_results
+from vector_store import search_law_sections
+from llm_utils import (LLM_CALL_TIMEOUT, cached_explanation, explanation_cache_key,
+                       get_explanation_cache, map_concurrently)
 from openai import OpenAI
 import json
 
@@ -18,7 +23,13 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 # Constants
 INDEX_NAME = "laws-names"
 COLLECTION_NAME = "laws"
+# Only what a result card renders; the full document is loaded on demand
+CARD_PROJECTION = {"IsraelLawID": 1, "Name": 1, "Description": 1, "PublicationDate": 1}
+RESULTS_SHOWN = 5
 OPENAI_API_KEY = os.getenv("OPEN_AI")
+EXPLANATION_MODEL = "gpt-3.5-turbo"
+# Version of the explanation prompt in cache keys (see cache_store.versioned_key)
+EXPLANATION_PROMPT_VERSION = 1
 
 # OpenAI Client
 openai_client = OpenAI(api_key=OPENAI_API_KEY)
@@ -27,8 +38,10 @@ openai_client = OpenAI(api_key=OPENAI_API_KEY)
 db = mongo_client[os.getenv("DATABASE_NAME")]
 collection = db[COLLECTION_NAME]
 
-# Pinecone Index
-index = pinecone_client.Index(INDEX_NAME)
+# Vector indexes (Pinecone or local, see app_resources.VECTOR_BACKEND)
+index = get_vector_index(INDEX_NAME)
+# Cross-encoder for reranking matches (None when RERANKER=0)
+reranker = load_reranker()
 
 # === Styling ===
 st.markdown("""
@@ -100,6 +113,51 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+def toggle_expansion(key):
+    st.session_state[key] = not st.session_state.get(key, False)
+
+
+# === Rank laws by their best-matching sections ===
+def search_laws(query_embedding, top_k=5):
+    """[(law_id, matching sections)] best first; falls back to the law-name index."""
+    section_index = get_law_section_index()
+    if section_index is not None:
+        try:
+            ranked = search_law_sections(section_index, query_embedding, top_k)
+            if ranked:
+                return [(law["IsraelLawID"], law["sections"]) for law in ranked]
+        except Exception as e:
+            st.warning(f"Section search unavailable, matching law names only: {str(e)}")
+    query_response = index.query(
+        vector=query_embedding.tolist(),
+        top_k=top_k,
+        include_metadata=True
+    )
+    matches = query_response.get("matches", []) if query_response else []
+    law_ids = dict.fromkeys(
+        m.get("metadata", {}).get("IsraelLawID") for m in matches
+        if m.get("metadata", {}).get("IsraelLawID") is not None
+    )
+    return [(law_id, []) for law_id in law_ids]
+
+
+def render_sections(sections):
+    with st.expander(f"📑 Matching sections ({len(sections)})"):
+        for section in sections:
+            title = f"סעיף {section.get('SectionNumber', '')} {section.get('SectionDescription', '')}".strip()
+            st.markdown(f"**{title}** · {section.get('score', 0):.2f}")
+            st.write(section.get("SectionContent", ""))
+
+
+# === Load the card fields for all matches in one query ===
+def load_law_cards(law_ids):
+    try:
+        return fetch_by_keys(collection, "IsraelLawID", law_ids, CARD_PROJECTION)
+    except Exception as e:
+        st.error(f"Error fetching laws: {str(e)}")
+        return {}
+
+
 # === Load full details for a single law ===
 def load_full_law_details(law_id):
     try:
@@ -108,8 +166,11 @@ def load_full_law_details(law_id):
         st.error(f"Error fetching full details for law ID {law_id}: {str(e)}")
         return None
 
+FALLBACK_EXPLANATION = {"advice": "לא ניתן לקבל הסבר בשלב זה.", "score": "N/A"}
+
+
 # === Get GPT Explanation for Why the Law Helps ===
-def get_law_explanation(scenario, law_doc):
+def request_law_explanation(scenario, law_doc):
     law_name = law_doc.get("Name", "")
     law_desc = law_doc.get("Description", "")
     prompt = f"""בהתבסס על הסצנריו הבא:
@@ -129,62 +190,135 @@ def get_law_explanation(scenario, law_doc):
 """
     try:
         response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model=EXPLANATION_MODEL,
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
+            temperature=0.7,
+            timeout=LLM_CALL_TIMEOUT
         )
         output = response.choices[0].message.content.strip()
         return json.loads(output)
     except Exception as e:
-        st.error(f"Error getting law explanation: {e}")
-        return {"advice": "לא ניתן לקבל הסבר בשלב זה.", "score": "N/A"}
+        # Runs on a worker thread, so the error is rendered by the caller
+        return {**FALLBACK_EXPLANATION, "error": f"Error getting law explanation: {e}"}
+
+
+def get_law_explanation(scenario, law_doc):
+    key = explanation_cache_key(scenario, law_doc.get("IsraelLawID"), EXPLANATION_PROMPT_VERSION, EXPLANATION_MODEL)
+    return cached_explanation(key, lambda: request_law_explanation(scenario, law_doc))
+
+
+def load_advice(scenario, result):
+    result["explanation"] = get_law_explanation(scenario, result["doc"])
+
+
+# === Rerank the vector-search candidates with the cross-encoder ===
+def law_rerank_text(result):
+    """The law's name plus its matching sections, or its description when none matched."""
+    doc = result["doc"]
+    body = "\n".join(s.get("SectionContent", "") for s in result.get("sections") or []) or doc.get("Description", "")
+    return f"{doc.get('Name', '')}\n{body}"
+
+
+def rank_laws(scenario, matches):
+    if reranker is None:
+        return matches[:RESULTS_SHOWN]
+    found = [m for m in matches if m["doc"]]
+    try:
+        return rerank_results(reranker, scenario, found, law_rerank_text, RESULTS_SHOWN)
+    except Exception as e:
+        st.warning(f"Reranking failed, showing vector-search order: {str(e)}")
+        return matches[:RESULTS_SHOWN]
+
+
+def render_explanation(placeholder, explanation):
+    advice = explanation.get("advice", "")
+    score = explanation.get("score", "N/A")
+    with placeholder.container():
+        if explanation.get("error"):
+            st.error(explanation["error"])
+        st.markdown(f"""
+            <div style="display: flex; justify-content: space-between; align-items: center;">
+                <span style="color: red;">עצת האתר: {advice}</span>
+                <span style="font-size: 24px; font-weight: bold; color: red;">{score}/10</span>
+            </div>
+        """, unsafe_allow_html=True)
 
 # === Main Interface ===
 st.title("Finding Suitable Law")
 scenario = st.text_area("Describe your scenario (what you plan to do, your situation, etc.):")
+eager_advice = st.checkbox("Get site advice for every result (slower)", value=False)
 
 if st.button("Find Suitable Laws") and scenario:
     with st.spinner("Generating query embedding..."):
-        query_embedding = model.encode([scenario], normalize_embeddings=True)[0]
+        query_embedding = embedder.encode_queries([scenario], normalize_embeddings=True)[0]
     with st.spinner("Querying Pinecone for similar laws..."):
-        query_response = index.query(
-            vector=query_embedding.tolist(),
-            top_k=5,
-            include_metadata=True
-        )
-    if query_response and query_response.get("matches"):
+        ranked_laws = search_laws(query_embedding, RERANK_CANDIDATES if reranker is not None else RESULTS_SHOWN)
+    law_docs = load_law_cards([law_id for law_id, _ in ranked_laws])
+    with st.spinner("Ranking laws..."):
+        ranked = rank_laws(scenario, [{"law_id": i, "doc": law_docs.get(i), "sections": sections}
+                                      for i, sections in ranked_laws])
+    st.session_state["law_results"] = {"scenario": scenario, "matches": ranked}
+
+results = st.session_state.get("law_results")
+if results:
+    if results["matches"]:
         st.markdown("### Suitable Laws Found:")
-        for match in query_response["matches"]:
-            metadata = match.get("metadata", {})
-            israel_law_id = metadata.get("IsraelLawID")
-            if israel_law_id is None:
-                continue
-            law_doc = load_full_law_details(israel_law_id)
+        pending = []
+        for result in results["matches"]:
+            israel_law_id = result["law_id"]
+            law_doc = result["doc"]
             if law_doc:
                 name = law_doc.get("Name", "No Name")
                 description = law_doc.get("Description", "אין תיאור לחוק זה")
                 publication_date = law_doc.get("PublicationDate", "N/A")
+                relevance_html = (f'<div class="law-meta">Relevance: {result["relevance"]}/10</div>'
+                                  if "relevance" in result else "")
                 st.markdown(f"""
                     <div class="law-card">
                         <div class="law-title">{name} (ID: {israel_law_id})</div>
                         <div class="law-description">{description}</div>
                         <div class="law-meta">Publication Date: {publication_date}</div>
+                        {relevance_html}
                     </div>
                 """, unsafe_allow_html=True)
-                with st.spinner("Getting site advice..."):
-                    result = get_law_explanation(scenario, law_doc)
-                    advice = result.get("advice", "")
-                    score = result.get("score", "N/A")
-                st.markdown(f"""
-                    <div style="display: flex; justify-content: space-between; align-items: center;">
-                        <span style="color: red;">עצת האתר: {advice}</span>
-                        <span style="font-size: 24px; font-weight: bold; color: red;">{score}/10</span>
-                    </div>
-                """, unsafe_allow_html=True)
-                if st.button(f"View Full Details for {israel_law_id}", key=f"details_{israel_law_id}"):
+                if result.get("sections"):
+                    render_sections(result["sections"])
+                # GPT advice is generated on demand, or for every card when eager_advice is set
+                placeholder = st.empty()
+                if "explanation" in result:
+                    render_explanation(placeholder, result["explanation"])
+                elif eager_advice:
+                    placeholder.markdown("⏳ Getting site advice...")
+                    pending.append((result, placeholder))
+                else:
+                    placeholder.button("💡 Get site advice", key=f"advice_{israel_law_id}",
+                                       on_click=load_advice, args=(results["scenario"], result))
+                state_key = f"details_expanded_{israel_law_id}"
+                st.button(
+                    f"View Full Details for {israel_law_id}" if not st.session_state.get(state_key, False)
+                    else f"Hide Full Details for {israel_law_id}",
+                    key=f"details_{israel_law_id}",
+                    on_click=toggle_expansion,
+                    args=(state_key,)
+                )
+                if st.session_state.get(state_key, False):
                     with st.spinner("Loading full details..."):
-                        st.json(law_doc)
+                        full_doc = load_full_law_details(israel_law_id)
+                    if full_doc:
+                        st.json(full_doc)
             else:
                 st.warning(f"No document found for IsraelLawID: {israel_law_id}")
+
+        # With eager_advice, explain every pending match in parallel and render each as it arrives
+        for position, explanation in map_concurrently(
+                lambda item: get_law_explanation(results["scenario"], item[0]["doc"]), pending):
+            result, placeholder = pending[position]
+            result["explanation"] = explanation or {
+                **FALLBACK_EXPLANATION, "error": "Timed out getting site advice."}
+            render_explanation(placeholder, result["explanation"])
+
+        cache_stats = get_explanation_cache().stats()
+        st.caption(f"Advice cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                   f"{cache_stats['entries']} stored")
     else:
         st.info("No similar laws found.")
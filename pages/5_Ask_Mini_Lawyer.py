@@ -1,29 +1,35 @@
 import os
+import time
 import streamlit as st
 import torch
 from openai import OpenAI
 from dotenv import load_dotenv
 from datetime import datetime
-from app_resources import mongo_client
-import uuid
-from streamlit_js import st_js, st_js_blocking
+from app_resources import get_conversation_store
+from llm_utils import stream_completion
+from context_builder import budget_for, forget_summary, openai_summarizer, split_history, update_summary
+from session_identity import conversation_result, reset_chat_id, resolve_chat_id, start_conversation_load
 
 # Fix for torch.classes error
 torch.classes.__path__ = []
 # Load environment variables
 load_dotenv()
 
-# MongoDB connection setup
-
-DATABASE_NAME = os.getenv("DATABASE_NAME")
-collection = mongo_client[DATABASE_NAME]["conversations"]
+# MongoDB conversations, appended to message by message
+conversation_store = get_conversation_store()
 
 # OpenAI API setup
 client_openai = OpenAI(api_key=os.getenv("OPEN_AI"))
+CHAT_MODEL = "gpt-4"
+summarize_history = openai_summarizer(client_openai)
 
 # Set page configuration
 st.set_page_config(page_title="Ask Mini Lawyer", page_icon="💬", layout="wide")
 
+# Resolve the chat id and start loading its history while the page renders
+local_storage_id = resolve_chat_id()
+start_conversation_load(conversation_store, local_storage_id)
+
 # Custom CSS styling
 st.markdown("""
     <style>
@@ -72,115 +78,106 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-# Functions for localStorage handling
-def get_localstorage_value(key: str):
-    """Get a value from localStorage using st_js_blocking"""
-    code = f"return localStorage.getItem('{key}');"
-    return st_js_blocking(code, key="get_" + key)
-
-
-def set_localstorage_value(key: str, value: str):
-    """Set a value in localStorage"""
-    code = f"localStorage.setItem('{key}', '{value}');"
-    st_js(code)
-
-
-def get_or_create_chat_id():
-    """Get existing chat ID or create a new one"""
-    if 'current_chat_id' not in st.session_state:
-        st.session_state.current_chat_id = None
-
-    chat_id = get_localstorage_value("MiniLawyerChatId")
-
-    if chat_id in (None, "null"):
-        if st.session_state.current_chat_id is None:
-            new_id = str(uuid.uuid4())
-            set_localstorage_value("MiniLawyerChatId", new_id)
-            st.session_state.current_chat_id = new_id
-            st.rerun()
-        else:
-            set_localstorage_value("MiniLawyerChatId", st.session_state.current_chat_id)
-            return st.session_state.current_chat_id
-    else:
-        if st.session_state.current_chat_id != chat_id:
-            st.session_state.current_chat_id = chat_id
-        return chat_id
-
-
-def save_conversation(local_storage_id, user_name, messages):
-    """Save messages to MongoDB."""
+def save_messages(local_storage_id, messages, user_name=None):
+    """Append new messages to the conversation in MongoDB."""
     try:
-        collection.update_one(
-            {"local_storage_id": local_storage_id},
-            {"$set": {"local_storage_id": local_storage_id, "user_name": user_name, "messages": messages}},
-            upsert=True
-        )
+        conversation_store.append(local_storage_id, messages, user_name=user_name)
     except Exception as e:
         st.error(f"Error saving conversation: {e}")
 
 
-def load_conversation(local_storage_id):
-    """Load messages from MongoDB."""
+def load_conversation():
+    """Collect the most recent messages loaded in the background."""
     try:
-        conversation = collection.find_one({"local_storage_id": local_storage_id})
-        if conversation:
-            st.session_state['user_name'] = conversation['user_name']
-            return conversation.get('messages', [])
-        return []
+        user_name, messages, total = conversation_result()
+        if user_name:
+            st.session_state['user_name'] = user_name
+        # Position of the first loaded message in the stored history
+        st.session_state['history_start'] = total - len(messages)
+        return messages
     except Exception as e:
         st.error(f"Error loading conversation: {e}")
         return []
 
 
+def load_earlier_messages(local_storage_id):
+    """Prepend the previous page of stored messages."""
+    try:
+        earlier = conversation_store.load_earlier(local_storage_id, st.session_state['history_start'])
+        st.session_state['messages'] = earlier + st.session_state['messages']
+        st.session_state['history_start'] -= len(earlier)
+    except Exception as e:
+        st.error(f"Error loading earlier messages: {e}")
+
+
 def delete_conversation(local_storage_id):
     """Delete the conversation document in MongoDB."""
     try:
-        collection.delete_one({"local_storage_id": local_storage_id})
-        # Clear localStorage
-        st_js("localStorage.clear();")
-        st.session_state.current_chat_id = None
+        conversation_store.delete(local_storage_id)
+        forget_summary(local_storage_id)
+        # A new chat id is created on the next run
+        reset_chat_id()
     except Exception as e:
         st.error(f"Error deleting conversation: {e}")
 
 
-def generate_response(user_input):
-    """Generate a GPT-4 response."""
+def generate_response(user_input, on_text=None):
+    """Stream a GPT-4 response, passing the text so far to `on_text`.
+
+    Returns (response, timings) with time-to-first-token and total latency.
+    """
     try:
         messages = [{"role": "system", "content": PROMPT_TEMPLATE}]
-        for msg in st.session_state['messages'][-5:]:
+        # The question is already the last message in the history, so it is sent once, at the end
+        history = st.session_state['messages'][:-1]
+        older, recent = split_history(history, budget_for("history"), CHAT_MODEL)
+        if older:
+            summary = update_summary(local_storage_id, older, st.session_state.get('history_start', 0),
+                                     summarize_history)
+            if summary:
+                messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        for msg in recent:
             messages.append({"role": msg['role'], "content": msg['content']})
         messages.append({"role": "user", "content": user_input})
 
-        response = client_openai.chat.completions.create(
-            model="gpt-4",
+        started = time.perf_counter()
+        stream = client_openai.chat.completions.create(
+            model=CHAT_MODEL,
             messages=messages,
             max_tokens=700,
-            temperature=0.7
+            temperature=0.7,
+            stream=True
         )
-        return response.choices[0].message.content.strip()
+        return stream_completion(stream, started, on_text)
     except Exception as e:
-        return f"Error: {str(e)}"
+        return f"Error: {str(e)}", {}
+
+
+def message_html(role, content, timestamp):
+    css_class = "user-message" if role == "user" else "bot-message"
+    return f"""
+            <div class="{css_class}">
+                {content}
+                <div class="timestamp">{timestamp}</div>
+            </div>
+        """
 
 
 def display_messages():
     """Display messages."""
     for msg in st.session_state['messages']:
-        role = "user-message" if msg['role'] == "user" else "bot-message"
-        st.markdown(f"""
-            <div class="{role}">
-                {msg['content']}
-                <div class="timestamp">{msg['timestamp']}</div>
-            </div>
-        """, unsafe_allow_html=True)
+        st.markdown(message_html(msg['role'], msg['content'], msg['timestamp']), unsafe_allow_html=True)
 
 
 def add_message(role, content):
-    """Add a message to session state."""
-    st.session_state['messages'].append({
+    """Add a message to session state and return it."""
+    message = {
         "role": role,
         "content": content,
         "timestamp": datetime.now().strftime("%H:%M:%S")
-    })
+    }
+    st.session_state['messages'].append(message)
+    return message
 
 
 # System Prompt
@@ -193,14 +190,11 @@ Answer always in Hebrew, and avoid using slang or informal language.
 # Main layout
 st.markdown('<div class="chat-header">💬 Ask Mini Lawyer</div>', unsafe_allow_html=True)
 
-# Get or create chat ID
-local_storage_id = get_or_create_chat_id()
-
 # Initialize session state
 if "user_name" not in st.session_state:
     st.session_state["user_name"] = None
 if "messages" not in st.session_state:
-    st.session_state["messages"] = load_conversation(local_storage_id)
+    st.session_state["messages"] = load_conversation()
 
 if not st.session_state["user_name"]:
     with st.form(key="user_name_form", clear_on_submit=True):
@@ -208,15 +202,35 @@ if not st.session_state["user_name"]:
         submitted_name = st.form_submit_button("Start Chat")
     if submitted_name and user_name_input:
         st.session_state["user_name"] = user_name_input.strip()
-        add_message("assistant", f"שלום {user_name_input}, איך אוכל לעזור לך היום?")
-        save_conversation(local_storage_id, user_name_input, st.session_state['messages'])
+        greeting = add_message("assistant", f"שלום {user_name_input}, איך אוכל לעזור לך היום?")
+        save_messages(local_storage_id, [greeting], user_name=user_name_input)
         st.rerun()
 else:
     # Chat display
     with st.container():
         st.markdown('<div class="chat-container">', unsafe_allow_html=True)
+        if st.session_state.get('history_start', 0) > 0:
+            st.button("Load earlier messages", on_click=load_earlier_messages, args=(local_storage_id,))
         display_messages()
+
+        # Stream the answer to a pending user message into the chat, then persist it once
+        if st.session_state['messages'] and st.session_state['messages'][-1]['role'] == "user":
+            answer_slot = st.empty()
+            timestamp = datetime.now().strftime("%H:%M:%S")
+            answer_slot.markdown(message_html("assistant", "⏳", timestamp), unsafe_allow_html=True)
+            assistant_response, timings = generate_response(
+                st.session_state['messages'][-1]['content'],
+                on_text=lambda text: answer_slot.markdown(
+                    message_html("assistant", text + " ▌", timestamp), unsafe_allow_html=True),
+            )
+            answer_slot.markdown(message_html("assistant", assistant_response, timestamp), unsafe_allow_html=True)
+            save_messages(local_storage_id, [add_message("assistant", assistant_response)])
+            st.session_state["llm_timings"] = timings
         st.markdown('</div>', unsafe_allow_html=True)
+    if st.session_state.get("llm_timings"):
+        timings = st.session_state["llm_timings"]
+        st.caption(f"⏱ first token {timings['first_token'] * 1000:.0f}ms · "
+                   f"full answer {timings['total'] * 1000:.0f}ms")
 
     # User input
     with st.form(key="chat_form", clear_on_submit=True):
@@ -224,22 +238,14 @@ else:
         submitted = st.form_submit_button("Submit")
 
     if submitted and user_input.strip():
-        add_message("user", user_input)
-        save_conversation(local_storage_id, st.session_state["user_name"], st.session_state['messages'])
-        st.rerun()
-
-    # Process GPT response
-    if st.session_state['messages'] and st.session_state['messages'][-1]['role'] == "user":
-        with st.spinner("Analyzing..."):
-            assistant_response = generate_response(st.session_state['messages'][-1]['content'])
-        add_message("assistant", assistant_response)
-        save_conversation(local_storage_id, st.session_state["user_name"], st.session_state['messages'])
+        save_messages(local_storage_id, [add_message("user", user_input)])
         st.rerun()
 
     # Clear chat
     if st.button("Clear Chat"):
         delete_conversation(local_storage_id)
         st.session_state['messages'] = []
+        st.session_state['history_start'] = 0
         st.session_state['user_name'] = None
         st.rerun()
 
@@ -1,11 +1,12 @@
 from app_resources import mongo_client
+from stats_aggregates import JUDGMENT_FACETS, LAW_FACETS, facet_counts
+from lawyers_data import ALL, LawyerIndex, TopLawyersCube, csv_mtime, load_lawyers
 import torch
 from matplotlib import rcParams
 import matplotlib.ticker as ticker
 import numpy as np
 import matplotlib.pyplot as plt
 import altair as alt
-import pandas as pd
 from streamlit_option_menu import option_menu
 import os
 import streamlit as st
@@ -23,6 +24,8 @@ rcParams['font.family'] = 'DejaVu Sans'
 DATABASE_NAME = os.getenv('DATABASE_NAME')
 LAWS_COLLECTION = "laws"
 JUDGMENTS_COLLECTION = "judgments"
+# Seconds before the aggregated counts are recomputed
+STATS_CACHE_TTL = 600
 
 # --- TOGGLE ---
 selected_dashboard = option_menu(
@@ -61,92 +64,71 @@ selected_dashboard = option_menu(
 
 # --- STATISTICS DASHBOARD ---
 if selected_dashboard == "General Statistics":
-    @st.cache_data(show_spinner=False)
-    def load_laws_data():
+    @st.cache_data(show_spinner=False, ttl=STATS_CACHE_TTL)
+    def load_laws_stats():
         db = mongo_client[DATABASE_NAME]
-        docs = list(db[LAWS_COLLECTION].find(
-            {}, {"PublicationDate": 1, "IsBasicLaw": 1, "IsFavoriteLaw": 1}
-        ))
-        df = pd.DataFrame(docs)
-        if not df.empty:
-            df = df.drop(columns=["_id"], errors="ignore")
-            df["PublicationDate"] = pd.to_datetime(
-                df["PublicationDate"], errors="coerce")
-        return df
-
-    @st.cache_data(show_spinner=False)
-    def load_judgments_data():
+        return facet_counts(db[LAWS_COLLECTION], LAW_FACETS)
+
+    @st.cache_data(show_spinner=False, ttl=STATS_CACHE_TTL)
+    def load_judgments_stats():
         db = mongo_client[DATABASE_NAME]
-        docs = list(db[JUDGMENTS_COLLECTION].find(
-            {}, {"DecisionDate": 1, "CourtType": 1, "ProcedureType": 1, "District": 1}
-        ))
-        df = pd.DataFrame(docs)
-        if not df.empty:
-            df = df.drop(columns=["_id"], errors="ignore")
-            df["DecisionDate"] = pd.to_datetime(
-                df["DecisionDate"], errors="coerce")
-        return df
+        return facet_counts(db[JUDGMENTS_COLLECTION], JUDGMENT_FACETS)
+
+    def distribution_chart(counts, field, title):
+        return alt.Chart(counts).mark_arc().encode(
+            theta=alt.Theta("count:Q", stack=True),
+            color=alt.Color(f"{field}:N", legend=alt.Legend(title=title))
+        ).properties(title=f"Distribution of {title}")
 
     st.title("General Statistics")
     st.info("Loading data...")
-    df_judgments = load_judgments_data()
-    df_laws = load_laws_data()
+    # Counts are grouped in Mongo; only the per-value totals reach the browser
+    judgments_stats = load_judgments_stats()
+    laws_stats = load_laws_stats()
     st.write("Data loaded.")
 
     st.header("Judgments Statistics")
-    if not df_judgments.empty:
-        timeline_chart = alt.Chart(df_judgments).mark_bar().encode(
-            x=alt.X("year(DecisionDate):O", title="Year"),
-            y=alt.Y("count()", title="Number of Judgments")
+    if any(not counts.empty for counts in judgments_stats.values()):
+        timeline_chart = alt.Chart(judgments_stats["Year"]).mark_bar().encode(
+            x=alt.X("Year:O", title="Year"),
+            y=alt.Y("count:Q", title="Number of Judgments")
         ).properties(title="Judgments Timeline (Decision Date)")
         st.altair_chart(timeline_chart, use_container_width=True)
 
-        if "CourtType" in df_judgments.columns:
-            court_chart = alt.Chart(df_judgments).mark_arc().encode(
-                theta=alt.Theta("count()", stack=True),
-                color=alt.Color(
-                    "CourtType:N", legend=alt.Legend(title="Court Type"))
-            ).properties(title="Distribution of Court Type")
-            st.altair_chart(court_chart, use_container_width=True)
-
-        if "ProcedureType" in df_judgments.columns:
-            procedure_chart = alt.Chart(df_judgments).mark_arc().encode(
-                theta=alt.Theta("count()", stack=True),
-                color=alt.Color("ProcedureType:N",
-                                legend=alt.Legend(title="Procedure Type"))
-            ).properties(title="Distribution of Procedure Type")
-            st.altair_chart(procedure_chart, use_container_width=True)
-
-        if "District" in df_judgments.columns:
-            district_chart = alt.Chart(df_judgments).mark_arc().encode(
-                theta=alt.Theta("count()", stack=True),
-                color=alt.Color(
-                    "District:N", legend=alt.Legend(title="District"))
-            ).properties(title="Distribution of District")
-            st.altair_chart(district_chart, use_container_width=True)
+        if not judgments_stats["CourtType"].empty:
+            st.altair_chart(distribution_chart(judgments_stats["CourtType"], "CourtType", "Court Type"),
+                            use_container_width=True)
+
+        if not judgments_stats["ProcedureType"].empty:
+            st.altair_chart(distribution_chart(judgments_stats["ProcedureType"], "ProcedureType", "Procedure Type"),
+                            use_container_width=True)
+
+        if not judgments_stats["District"].empty:
+            st.altair_chart(distribution_chart(judgments_stats["District"], "District", "District"),
+                            use_container_width=True)
     else:
         st.info("No judgments data available.")
 
     st.markdown("---")
     st.header("Laws Statistics")
-    if not df_laws.empty:
-        timeline_laws = alt.Chart(df_laws).mark_bar().encode(
-            x=alt.X("year(PublicationDate):O", title="Year"),
-            y=alt.Y("count()", title="Number of Laws")
+    if any(not counts.empty for counts in laws_stats.values()):
+        timeline_laws = alt.Chart(laws_stats["Year"]).mark_bar().encode(
+            x=alt.X("Year:O", title="Year"),
+            y=alt.Y("count:Q", title="Number of Laws")
         ).properties(title="Laws Timeline (Publication Date)")
         st.altair_chart(timeline_laws, use_container_width=True)
 
-        if "IsBasicLaw" in df_laws.columns:
-            basic_chart = alt.Chart(df_laws).mark_bar().encode(
+        if not laws_stats["IsBasicLaw"].empty:
+            basic_chart = alt.Chart(laws_stats["IsBasicLaw"]).mark_bar().encode(
                 x=alt.X("IsBasicLaw:N", title="Is Basic Law (True/False)"),
-                y=alt.Y("count()", title="Count")
+                y=alt.Y("count:Q", title="Count")
             ).properties(title="Distribution of IsBasicLaw")
             st.altair_chart(basic_chart, use_container_width=True)
 
-        if "IsFavoriteLaw" in df_laws.columns:
-            favorite_chart = alt.Chart(df_laws).mark_bar().encode(
+        if not laws_stats["IsFavoriteLaw"].empty:
+            favorite_chart = alt.Chart(laws_stats["IsFavoriteLaw"]).mark_bar().encode(
                 x=alt.X("IsFavoriteLaw:N", title="Is Favorite Law (True/False)"),
-                y=alt.Y("count()", title="Count")
+                y=alt.Y("count:Q", title="Count")
             ).properties(title="Distribution of IsFavoriteLaw")
             st.altair_chart(favorite_chart, use_container_width=True)
     else:
@@ -155,14 +137,20 @@ if selected_dashboard == "General Statistics":
 
 # --- LAWYERS DASHBOARD ---
 if selected_dashboard == "Lawyers Statistics":
-    @st.cache_data
-    def load_data():
-        project_root = os.path.abspath(
-            os.path.join(os.path.dirname(__file__), '..'))
-        file_path = os.path.join(project_root, "data",
-                                 "lawyers_with_case_info.csv")
-        df = pd.read_csv(file_path)
-        return df
+    # One shared, memory-mapped frame per CSV version (see lawyers_data.py); never modified in place
+    @st.cache_resource(show_spinner=False, max_entries=1)
+    def load_data(source_mtime):
+        return load_lawyers()
+
+    # Built once per CSV version: per-lawyer row offsets, counts and split case names
+    @st.cache_resource(show_spinner=False, max_entries=1)
+    def load_lawyer_index(source_mtime):
+        return LawyerIndex(load_data(source_mtime))
+
+    # Top 5 lawyers for every ProcedureType x CourtType selection, built once per CSV version
+    @st.cache_resource(show_spinner=False, max_entries=1)
+    def load_top_lawyers_cube(source_mtime):
+        return TopLawyersCube(load_data(source_mtime))
 
     def reverse_hebrew(s):
         try:
@@ -170,8 +158,7 @@ if selected_dashboard == "Lawyers Statistics":
         except:
             return s
 
-    df = load_data()
-    df = df.dropna(subset=["ProcedureType", "CourtType", "LawyerName"])
+    df = load_data(csv_mtime())
 
     st.title("⚖️ דשבורד עורכי דין ממסמכים משפטיים")
     st.markdown(
@@ -181,27 +168,15 @@ if selected_dashboard == "Lawyers Statistics":
     st.markdown("---")
     st.header("🔝 טופ 5 עורכי דין לפי תחום וערכאה")
 
-    procedure_options = ["הכל"] + sorted(df["ProcedureType"].dropna().unique())
-    court_options = ["הכל"] + sorted(df["CourtType"].dropna().unique())
+    procedure_options = [ALL] + sorted(df["ProcedureType"].cat.categories)
+    court_options = [ALL] + sorted(df["CourtType"].cat.categories)
 
     col_filters = st.columns(2)
     selected_proc = col_filters[0].selectbox(
         "בחר תחום משפטי:", procedure_options)
     selected_court = col_filters[1].selectbox("בחר ערכאה:", court_options)
 
-    filtered = df.copy()
-    if selected_proc != "הכל":
-        filtered = filtered[filtered["ProcedureType"] == selected_proc]
-    if selected_court != "הכל":
-        filtered = filtered[filtered["CourtType"] == selected_court]
-
-    top_lawyers = (
-        filtered.groupby("LawyerName")
-        .size()
-        .reset_index(name="Count")
-        .sort_values("Count", ascending=False)
-        .head(5)
-    )
+    top_lawyers = load_top_lawyers_cube(csv_mtime()).top_lawyers(selected_proc, selected_court)
 
     if top_lawyers.empty:
         st.warning("⚠️ אין נתונים עבור הקטגוריות שנבחרו.")
@@ -229,12 +204,17 @@ if selected_dashboard == "Lawyers Statistics":
 
     st.markdown("---")
     st.header("👤 פרופיל אישי - סטטיסטיקה לכל עורך דין")
-    lawyer_names = sorted(df["LawyerName"].dropna().unique())
+    lawyer_index = load_lawyer_index(csv_mtime())
+    lawyer_names = sorted(lawyer_index.names)
     selected_lawyer = st.selectbox("בחר עורך דין:", lawyer_names)
-    lawyer_df = df[df["LawyerName"] == selected_lawyer]
+    profile = lawyer_index.profile(selected_lawyer)
+    if profile is None:
+        st.info("אין נתונים על עורכי דין להצגה.")
+        st.stop()
+    lawyer_df = profile["cases"]
     total_cases = lawyer_df.shape[0]
-    unique_fields = lawyer_df["ProcedureType"].nunique()
-    unique_courts = lawyer_df["CourtType"].nunique()
+    unique_fields = len(profile["ProcedureType"])
+    unique_courts = len(profile["CourtType"])
 
     with st.container():
         stats_cols = st.columns(3)
@@ -246,7 +226,7 @@ if selected_dashboard == "Lawyers Statistics":
         chart_cols = st.columns(2)
         with chart_cols[0]:
             st.subheader("📊 התפלגות לפי תחום משפטי")
-            pie_data = lawyer_df["ProcedureType"].value_counts()
+            pie_data = profile["ProcedureType"]
             fig1, ax1 = plt.subplots(figsize=(4, 2.5))
             colors_pie = plt.cm.Paired(np.linspace(0, 1, len(pie_data)))
             ax1.pie(pie_data, labels=[reverse_hebrew(label) for label in pie_data.index],
@@ -255,7 +235,7 @@ if selected_dashboard == "Lawyers Statistics":
             st.pyplot(fig1)
         with chart_cols[1]:
             st.subheader("🏛 התפלגות לפי ערכאה")
-            bar_data = lawyer_df["CourtType"].value_counts()
+            bar_data = profile["CourtType"]
             fig2, ax2 = plt.subplots(figsize=(4, 2.5))
             colors_bar = plt.cm.Set2(np.linspace(0.2, 0.8, len(bar_data)))
             ax2.bar([reverse_hebrew(label) for label in bar_data.index],
@@ -270,18 +250,6 @@ if selected_dashboard == "Lawyers Statistics":
     st.markdown("---")
     st.subheader("📄 רשימת תיקים של עורך הדין")
     if "CaseName" in lawyer_df.columns and "CaseURL" in lawyer_df.columns:
-        def split_case_name(full_name):
-            if not isinstance(full_name, str):
-                return pd.Series([None, None])
-            parts = full_name.split(",", 1)
-            if len(parts) == 2:
-                return pd.Series([parts[0].strip(), parts[1].strip()])
-            return pd.Series([None, full_name.strip()])
-
-        # lawyer_df.loc[:, ["בית משפט", "שם תיק"]] = lawyer_df["CaseName"].apply(
-        #     lambda x: pd.Series(split_case_name(x)))
-        lawyer_df[["בית משפט", "שם תיק"]] = lawyer_df["CaseName"].apply(split_case_name)
-
         # def make_button(url):
         #     clean_url = str(url).strip().replace('\n', '')
         #     return f"""
@@ -310,9 +278,8 @@ if selected_dashboard == "Lawyers Statistics":
         # onmouseout="this.style.backgroundColor='#4CAF50'"><button></a/>מעבר לפסק הדין'''
             return f'<a href="{clean_url}" target="_blank"><button style="padding:6px 10px; background-color:#4CAF50; color:white; border:none; border-radius:8px; font-size:14px; cursor:pointer;">מעבר לפסק הדין</button></a>'
 
-        lawyer_df.loc[:, "מעבר לפסק הדין"] = lawyer_df["CaseURL"].apply(
-            make_button)
-        final_table = lawyer_df[["שם תיק", "בית משפט", "מעבר לפסק הדין"]]
+        final_table = lawyer_df[["שם תיק", "בית משפט"]].assign(
+            **{"מעבר לפסק הדין": lawyer_df["CaseURL"].apply(make_button)})
         st.write(
             final_table.to_html(escape=False, index=False),
             unsafe_allow_html=True
@@ -1,16 +1,24 @@
-import os, sys, json, uuid, asyncio, re
+import os, sys, json, asyncio, re, hashlib, time
 from datetime import datetime
 
 import streamlit as st
 st.set_page_config(page_title="Ask Mini Lawyer Suite", page_icon="⚖️", layout="wide")
 
-import torch, fitz, docx, numpy as np
+import torch, numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
-from streamlit_js import st_js, st_js_blocking
 
-from app_resources import mongo_client, pinecone_client, model
+from app_resources import mongo_client, embedder, get_vector_index, get_law_section_index, get_conversation_store, PINECONE_MAX_CONCURRENCY
+from mongo_lookup import afetch_by_keys
+from doc_processing import DOC_MAX_CHARS, DOC_MAX_PAGES, chunk_text, content_hash, extract_in_background
+from doc_summarizer import condense_document
+from doc_classifier import classify_in_background
+from session_identity import conversation_result, reset_chat_id, resolve_chat_id, start_conversation_load
+from llm_utils import astream_completion
+from context_builder import (budget_for, fit_snippets, forget_summary, openai_summarizer,
+                             split_history, truncate_to_tokens, update_summary)
+from vector_store import SECTION_FANOUT, collapse_section_matches
 
 # ------------------------------------------------------------
 # Environment & Globals
@@ -21,20 +29,30 @@ OPENAI_API_KEY = os.getenv("OPEN_AI")
 
 client_async_openai = AsyncOpenAI(api_key=OPENAI_API_KEY)
 client_sync_openai  = OpenAI(api_key=OPENAI_API_KEY)
+ANSWER_MODEL = "gpt-4o-mini"
+summarize_history = openai_summarizer(client_sync_openai)
 
 torch.classes.__path__ = []           
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+CHUNK_EMBED_BATCH_SIZE = int(os.getenv("CHUNK_EMBED_BATCH_SIZE", "16"))
+# Document chunks used as retrieval queries
+MAX_QUERY_CHUNKS = 20
+
 # ------------------------------------------------------------
 # Pinecone & Mongo
 # ------------------------------------------------------------
-judgment_index = pinecone_client.Index("judgments-names")
-law_index      = pinecone_client.Index("laws-names")
+judgment_index = get_vector_index("judgments-names")
+law_index      = get_vector_index("laws-names")
 
 db                    = mongo_client[DATABASE_NAME]
 judgment_collection   = db["judgments"]
 law_collection        = db["laws"]
-conversation_coll     = db["conversations"]
+conversation_store    = get_conversation_store()
+
+# מזהה השיחה נקבע פעם אחת לכל סשן; ההיסטוריה נטענת ברקע בזמן שהעמוד מצויר
+chat_id = resolve_chat_id()
+start_conversation_load(conversation_store, chat_id)
 
 # ------------------------------------------------------------
 # Streamlit UI
@@ -131,95 +149,128 @@ app_mode = "Chat Assistant"
 # ------------------------------------------------------------
 # Utility
 # ------------------------------------------------------------
-def get_localstorage_value(key: str):
-    return st_js_blocking(f"return localStorage.getItem('{key}');", key="get_"+key)
-
-def set_localstorage_value(key: str, val: str):
-    st_js(f"localStorage.setItem('{key}', '{val}');")
-
-def read_pdf(f):
-    return "".join(p.get_text() for p in fitz.open(stream=f.read(), filetype="pdf"))
-
-def read_docx(f):
-    return "\n".join(p.text for p in docx.Document(f).paragraphs)
-
 def add_message(role, content):
-    st.session_state.setdefault("messages", []).append({
-        "role": role,
-        "content": content,
-        "timestamp": datetime.now().strftime("%H:%M:%S")})
+    msg = {"role": role, "content": content, "timestamp": datetime.now().strftime("%H:%M:%S")}
+    st.session_state.setdefault("messages", []).append(msg)
+    return msg
+
+def uploaded_doc_text():
+    """The uploaded document's text ("" without one), waiting for the background extraction if it is still running.
+
+    Classification is started as soon as the text is in.
+    """
+    future = st.session_state.pop("doc_extract_future", None)
+    if future is not None:
+        extracted = future.result()
+        st.session_state["uploaded_doc_text"] = extracted["text"]
+        st.session_state["uploaded_doc_truncated"] = extracted["truncated"]
+        st.session_state["doc_type_future"] = classify_in_background(
+            client_sync_openai, extracted["text"], st.session_state["uploaded_doc_hash"])
+    return st.session_state.get("uploaded_doc_text", "")
+
+def show_doc_status(slot):
+    uploaded_doc_text()
+    with slot.container():
+        st.success("המסמך נטען – שורות באנגלית סוננו!")
+        if st.session_state.get("uploaded_doc_truncated"):
+            st.warning(f"המסמך ארוך – נקראו עד {DOC_MAX_PAGES} עמודים / {DOC_MAX_CHARS:,} תווים ראשונים.")
+
+def current_doc_type():
+    """The uploaded document's type, waiting for the background classification if it is still running."""
+    uploaded_doc_text()
+    future = st.session_state.pop("doc_type_future", None)
+    if future is not None:
+        st.session_state["doc_type"] = future.result()
+    return st.session_state.get("doc_type", "מסמך")
+
+def load_earlier_messages(chat_id):
+    earlier = conversation_store.load_earlier(chat_id, st.session_state["history_start"])
+    st.session_state["messages"] = earlier + st.session_state["messages"]
+    st.session_state["history_start"] -= len(earlier)
+
+def message_html(role, content, timestamp):
+    cls = "user-message" if role == "user" else "bot-message"
+    return f"<div class='{cls}'>{content}<div class='timestamp'>{timestamp}</div></div>"
 
 def display_messages():
     for m in st.session_state.get("messages", []):
-        cls = "user-message" if m["role"] == "user" else "bot-message"
-        st.markdown(
-            f"<div class='{cls}'>{m['content']}<div class='timestamp'>{m['timestamp']}</div></div>",
-            unsafe_allow_html=True
-        )
+        st.markdown(message_html(m["role"], m["content"], m["timestamp"]), unsafe_allow_html=True)
 
 # ------------------------------------------------------------
 # Text helpers
 # ------------------------------------------------------------
-def chunk_text(txt, max_len=450):
-    sentences = re.split(r'(?:\.|\?|!)\s+', txt)
-    chunks, cur = [], ""
-    for s in sentences:
-        if len(cur) + len(s) > max_len and cur:
-            chunks.append(cur.strip())
-            cur = s
-        else:
-            cur += " " + s
-    if cur.strip():
-        chunks.append(cur.strip())
-    return chunks[:20]
+def text_hash(txt: str) -> str:
+    return hashlib.sha256(txt.encode("utf-8")).hexdigest()
+
+def get_chunk_embeddings(doc_text: str):
+    """Chunks of the uploaded document and their embedding matrix.
+
+    Encoded in one batched call the first time a document is seen and kept in
+    the session under its hash, so later questions reuse the matrix.
+    """
+    doc_hash = text_hash(doc_text)
+    cached = st.session_state.get("chunk_embeddings")
+    if cached and cached["doc_hash"] == doc_hash:
+        return cached["chunks"], cached["matrix"]
+    chunks = chunk_text(doc_text, max_chunks=MAX_QUERY_CHUNKS)
+    matrix = (embedder.encode_queries(chunks, normalize_embeddings=True, batch_size=CHUNK_EMBED_BATCH_SIZE)
+              if chunks else np.empty((0, 0), dtype=np.float32))
+    st.session_state["chunk_embeddings"] = {"doc_hash": doc_hash, "chunks": chunks, "matrix": matrix}
+    return chunks, matrix
 
 # ------------------------------------------------------------
-# Robust document classifier
+# Retrieval
 # ------------------------------------------------------------
-CLS_PROMPT = """
-אתה מסווג מסמכים משפטיים. החזר *מילה אחת בלבד* מתוך הרשימה:
-מכתב_פיטורין, חוזה, תקנון, תביעה, פסק_דין, מכתב_אחר
-
-• **מכתב_פיטורין** – הודעה על סיום העסקה (termination notice), כוללת תאריך סיום, פיצויי פיטורין, הודעה מוקדמת.
-• **תביעה** – כתב תביעה לבית-משפט, עם תובע/נתבע וסעד מבוקש.
-• **חוזה**  – הסכם בין צדדים עם סעיפים הדדיים.
-• **תקנון** – כללים/נהלים כלליים (לרוב פורמט PDF של חברה/עמותה).
-• **פסק_דין** – החלטה סופית של בית-משפט.
-• **מכתב_אחר** – כל מכתב רשמי שלא מתאים לקטגוריות לעיל.
-
-דוגמה:  
-«הריני להודיעך על הפסקת עבודתך בחברה…» → מכתב_פיטורין  
-«בית-הדין הנכבד מתבקש לחייב את הנתבע…» → תביעה
-
-הטקסט:
-"""
-KEYWORD_OVERRIDES = {
-    r"פיטור(ין|ים)|סיום העסק(ה|תך)|הודעה על סיום|חשבונ(ך|ו) ייערך|termination notice|פיטורים|שימוע": "מכתב_פיטורין",
-    r"כתב\s+תביעה|הנתבע|התובע": "תביעה",
-}
-
-def classify_doc(clean_txt: str, debug_mode=False) -> str:
-    sample = clean_txt[:800] + "\n\n---\n\n" + clean_txt[-800:]
-    try:
-        resp = client_sync_openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "system", "content": CLS_PROMPT + sample}],
-            temperature=0.0,
-            max_tokens=5,
-        )
-        cat = resp.choices[0].message.content.strip()
-    except Exception:
-        cat = "מכתב_אחר"
-    if debug_mode:
-        st.write("GPT סיווג ראשוני:", cat)
-    # override heuristic
-    for pattern, override in KEYWORD_OVERRIDES.items():
-        if re.search(pattern, clean_txt, re.I):
-            if debug_mode:
-                st.write(f"Override מופעל: {pattern} => {override}")
-            cat = override
-            break
-    return cat
+KEY_FIELDS = {"law": "IsraelLawID", "judgment": "CaseNumber"}
+# Fields the prompt builder reads from each source
+SOURCE_PROJECTION = {"Name": 1, "Description": 1, "IsraelLawID": 1, "CaseNumber": 1}
+
+async def query_indexes(queries):
+    """Run every (vector, top_k) query against both indexes.
+
+    All queries share the pooled index connections; at most
+    PINECONE_MAX_CONCURRENCY requests are in flight at once.
+    Laws are matched on the section index when available; each law match
+    then carries its best "sections".
+    Returns {"law": [matches], "judgment": [matches]}.
+    """
+    semaphore = asyncio.Semaphore(PINECONE_MAX_CONCURRENCY)
+
+    async def run(index, vector, top_k):
+        async with semaphore:
+            res = await asyncio.to_thread(index.query, vector=vector.tolist(), top_k=top_k, include_metadata=True)
+        return res.get("matches", [])
+
+    law_section_index = get_law_section_index()
+
+    async def run_laws(vector, top_k):
+        if law_section_index is None:
+            return await run(law_index, vector, top_k)
+        try:
+            section_matches = await run(law_section_index, vector, top_k * SECTION_FANOUT)
+        except Exception:
+            return await run(law_index, vector, top_k)
+        laws = collapse_section_matches(section_matches, top_k)
+        if not laws:
+            # Empty or partly built section index
+            return await run(law_index, vector, top_k)
+        return [{"metadata": {"IsraelLawID": law["IsraelLawID"]}, "score": law["score"], "sections": law["sections"]}
+                for law in laws]
+
+    law_results, judgment_results = await asyncio.gather(
+        asyncio.gather(*(run_laws(vec, k) for vec, k in queries)),
+        asyncio.gather(*(run(judgment_index, vec, k) for vec, k in queries)),
+    )
+    return {
+        "law": [m for res in law_results for m in res],
+        "judgment": [m for res in judgment_results for m in res],
+    }
+
+def format_timings(timings: dict) -> str:
+    stages = " · ".join(f"{stage} {timings[stage] * 1000:.0f}ms"
+                        for stage in ("embedding", "vector_search", "mongo", "first_token", "answer")
+                        if stage in timings)
+    return f"⏱ {stages} ({timings.get('queries', 0)} queries, {timings.get('unique_ids', 0)} unique sources)"
 
 
 # ------------------------------------------------------------
@@ -229,15 +280,11 @@ def chat_assistant():
     st.markdown('<div class="chat-header">💬 Ask Mini Lawyer</div>', unsafe_allow_html=True)
 
     # ---------- session & history ----------
-    if "current_chat_id" not in st.session_state:
-        cid = get_localstorage_value("MiniLawyerChatId") or str(uuid.uuid4())
-        set_localstorage_value("MiniLawyerChatId", cid)
-        st.session_state.current_chat_id = cid
-    chat_id = st.session_state.current_chat_id
-
     if "messages" not in st.session_state:
-        convo = conversation_coll.find_one({"local_storage_id": chat_id})
-        st.session_state["messages"] = convo.get("messages", []) if convo else []
+        # רק חלון ההודעות האחרונות; הודעות קודמות נטענות לפי בקשה
+        _, messages, total = conversation_result()
+        st.session_state["messages"] = messages
+        st.session_state["history_start"] = total - len(messages)
     st.session_state.setdefault("user_name", None)
 
     # ---------- user name ----------
@@ -246,59 +293,70 @@ def chat_assistant():
             n = st.text_input("הכנס שם להתחלת שיחה:")
             if st.form_submit_button("התחל שיחה") and n:
                 st.session_state["user_name"] = n
-                add_message("assistant", f"שלום {n}, איך אפשר לעזור?")
-                conversation_coll.update_one(
-                    {"local_storage_id": chat_id},
-                    {"$set": {"user_name": n, "messages": st.session_state["messages"]}},
-                    upsert=True,
-                )
+                greeting = add_message("assistant", f"שלום {n}, איך אפשר לעזור?")
+                conversation_store.append(chat_id, [greeting], user_name=n)
                 st.rerun()
         return
 
     # ---------- chat window ----------
     with st.container():
         st.markdown('<div class="chat-container">', unsafe_allow_html=True)
+        if st.session_state.get("history_start", 0) > 0:
+            st.button("⬆ טען הודעות קודמות", on_click=load_earlier_messages, args=(chat_id,))
         display_messages()
+        # The next question and its streamed answer render here
+        answer_slot = st.empty()
         st.markdown("</div>", unsafe_allow_html=True)
-
-    # ---------- helper to strip english ----------
-    def strip_english_lines(text: str) -> str:
-        return "\n".join([ln for ln in text.splitlines() if len(re.findall(r"[א-ת]", ln)) > 6])
+    if "retrieval_timings" in st.session_state:
+        st.caption(format_timings(st.session_state["retrieval_timings"]))
 
     # ---------- file upload ----------
     uploaded = st.file_uploader("📄 העלה מסמך משפטי", type=["pdf", "docx"])
     if uploaded:
-        raw_txt   = read_pdf(uploaded) if uploaded.type == "application/pdf" else read_docx(uploaded)
-        clean_txt = strip_english_lines(raw_txt)
-        st.session_state["uploaded_doc_text"] = clean_txt
-        st.success("המסמך נטען – שורות באנגלית סוננו!")
-
-        # === classification ===
-        st.session_state["doc_type"] = classify_doc(clean_txt)
-        st.success(f"📄 סוג המסמך שזוהה: {st.session_state['doc_type']}")
+        data = uploaded.getvalue()
+        doc_hash = content_hash(data)
+        # רק כשמועלה קובץ חדש: חילוץ בשרשור רקע (עם מטמון לפי hash), ואחריו סיווג.
+        # הטקסט נאסף רק כשצריך אותו או בסוף הריצה (uploaded_doc_text)
+        if st.session_state.get("uploaded_doc_hash") != doc_hash:
+            st.session_state["uploaded_doc_hash"] = doc_hash
+            for key in ("uploaded_doc_text", "uploaded_doc_truncated", "doc_type", "doc_type_future"):
+                st.session_state.pop(key, None)
+            st.session_state["doc_extract_future"] = extract_in_background(data, uploaded.type)
+        doc_status_slot = st.empty()
+        if "doc_extract_future" in st.session_state:
+            doc_status_slot.info("📄 מחלץ טקסט מהמסמך...")
+        else:
+            show_doc_status(doc_status_slot)
+        doc_type_slot = st.empty()
+        doc_type_slot.info("📄 מזהה את סוג המסמך...")
 
     # ---------- summarise ----------
-    if "uploaded_doc_text" in st.session_state and st.button("📋 סכם את המסמך"):
+    if "uploaded_doc_hash" in st.session_state and st.button("📋 סכם את המסמך"):
         with st.spinner("MiniLawyer מסכם את המסמך..."):
-            doc_type = st.session_state.get("doc_type", "מסמך")
-            sum_prompt = (
-                f"אתה עורך-דין מומחה. סכם את המסמך הבא בעברית בלבד ובמבנה קבוע:\n"
-                f"כותרת: סיכום {doc_type}\n"
-                f"1. תקציר מנהלים – עד 100 מילים.\n"
-                f"2. נקודות עיקריות – רשימת בולטים (מועדים, סכומים, סיכונים).\n"
-                f"3. השלכות והמלצות מעשיות.\n"
-                f"עליך להשתמש בעברית בלבד. אין להכניס אף מילה באנגלית.\n"
-                f"אם המסמך הוא מכתב פיטורין, הדגש זאת במפורש בכותרת.\n"
-                f"—\n" + st.session_state["uploaded_doc_text"] + "\n—"
-            )
-            r = asyncio.run(
-                client_async_openai.chat.completions.create(
+            doc_type = current_doc_type()
+
+            async def summarize_document(doc_text):
+                # מסמך ארוך מסוכם קודם חלק-חלק (במקביל, עם מטמון לכל חלק) ורק אז בפרומפט הסופי
+                condensed = await condense_document(client_async_openai, doc_text)
+                source_note = "" if condensed is doc_text else "(להלן סיכומי חלקי המסמך לפי הסדר)\n"
+                sum_prompt = (
+                    f"אתה עורך-דין מומחה. סכם את המסמך הבא בעברית בלבד ובמבנה קבוע:\n"
+                    f"כותרת: סיכום {doc_type}\n"
+                    f"1. תקציר מנהלים – עד 100 מילים.\n"
+                    f"2. נקודות עיקריות – רשימת בולטים (מועדים, סכומים, סיכונים).\n"
+                    f"3. השלכות והמלצות מעשיות.\n"
+                    f"עליך להשתמש בעברית בלבד. אין להכניס אף מילה באנגלית.\n"
+                    f"אם המסמך הוא מכתב פיטורין, הדגש זאת במפורש בכותרת.\n"
+                    f"{source_note}—\n" + condensed + "\n—"
+                )
+                return await client_async_openai.chat.completions.create(
                     model="gpt-3.5-turbo",
                     messages=[{"role": "user", "content": sum_prompt}],
                     temperature=0.1,
                     max_tokens=700,
                 )
-            )
+
+            r = asyncio.run(summarize_document(uploaded_doc_text()))
             summary = r.choices[0].message.content.strip()
             # סינון שורות ללא עברית
             summary_hebrew = "\n".join([ln for ln in summary.splitlines() if re.search(r"[א-ת]", ln)])
@@ -312,55 +370,68 @@ def chat_assistant():
 
     # ---------- retrieval ----------
     async def retrieve_sources(question: str):
+        timings = {}
+
         # Generating embedding for the question and document sections
-        q_emb = model.encode([question], normalize_embeddings=True)[0]
-        section_embs = (
-            [model.encode([sec], normalize_embeddings=True)[0] for sec in chunk_text(st.session_state["uploaded_doc_text"])]
-            if "uploaded_doc_text" in st.session_state else []
+        t0 = time.perf_counter()
+        q_emb = embedder.encode_queries([question], normalize_embeddings=True)[0]
+        doc_text = uploaded_doc_text()
+        section_embs = get_chunk_embeddings(doc_text)[1] if doc_text else []
+        timings["embedding"] = time.perf_counter() - t0
+
+        # חיפוש לפי מקטעים מהמסמך (top_k 2) ולפי השאלה (top_k 7), בכל האינדקסים במקביל
+        t0 = time.perf_counter()
+        queries = [(emb, 2) for emb in section_embs] + [(q_emb, 7)]
+        matches = await query_indexes(queries)
+        timings["vector_search"] = time.perf_counter() - t0
+
+        # איחוד מזהים כפולים לפני הפנייה ל-Mongo
+        scores = {"law": {}, "judgment": {}}
+        sections = {}  # law id -> {(section number, content): best matching section}
+        for kind, kind_matches in matches.items():
+            for m in kind_matches:
+                doc_id = m.get("metadata", {}).get(KEY_FIELDS[kind])
+                if doc_id:
+                    scores[kind].setdefault(doc_id, []).append(m.get("score", 0))
+                    for section in m.get("sections", []):
+                        section_key = (section["SectionNumber"], section["SectionContent"])
+                        best = sections.setdefault(doc_id, {}).get(section_key)
+                        if best is None or section["score"] > best["score"]:
+                            sections[doc_id][section_key] = section
+
+        # שליפה אחת ($in) לכל אוסף, שתיהן במקביל ומחוץ ל-event loop
+        t0 = time.perf_counter()
+        law_docs, judgment_docs = await asyncio.gather(
+            afetch_by_keys(law_collection, "IsraelLawID", list(scores["law"]), SOURCE_PROJECTION),
+            afetch_by_keys(judgment_collection, "CaseNumber", list(scores["judgment"]), SOURCE_PROJECTION),
         )
-        candidates = {"law": {}, "judgment": {}}
-
-        async def add_candidate(match, kind):
-            meta = match.get("metadata", {})
-            score = match.get("score", 0)
-            doc_id = meta.get("IsraelLawID" if kind == "law" else "CaseNumber")
-            if not doc_id:
-                return
-            doc = (law_collection.find_one({"IsraelLawID": doc_id}) if kind == "law"
-                else judgment_collection.find_one({"CaseNumber": doc_id}))
-            if not doc:
-                return
-            candidates[kind].setdefault(doc_id, {"doc": doc, "scores": []})["scores"].append(score)
-
-        # חיפוש לפי מקטעים מהמסמך
-        
-        async def process_section(emb):
-            res_law, res_jud = await asyncio.gather(
-                asyncio.to_thread(law_index.query,      vector=emb.tolist(), top_k=2, include_metadata=True),
-                asyncio.to_thread(judgment_index.query, vector=emb.tolist(), top_k=2, include_metadata=True),
-            )
-            for m in res_law.get("matches", []):
-                await add_candidate(m, "law")
-            for m in res_jud.get("matches", []):
-                await add_candidate(m, "judgment")
-
-        await asyncio.gather(*(process_section(e) for e in section_embs))
-
-        # חיפוש לפי השאלה עם top_k 
-        for m in law_index.query(vector=q_emb.tolist(), top_k=7, include_metadata=True).get("matches", []):
-            await add_candidate(m, "law")
-        for m in judgment_index.query(vector=q_emb.tolist(), top_k=7, include_metadata=True).get("matches", []):
-            await add_candidate(m, "judgment")
+        candidates = {
+            kind: {doc_id: {"doc": doc, "scores": scores[kind][doc_id]} for doc_id, doc in docs.items()}
+            for kind, docs in (("law", law_docs), ("judgment", judgment_docs))
+        }
+        timings["mongo"] = time.perf_counter() - t0
 
         # מיון דירוג לפי ממוצע score
         top_laws = sorted(candidates["law"].values(), key=lambda x: -np.mean(x["scores"]))[:3]
         top_judgments = sorted(candidates["judgment"].values(), key=lambda x: -np.mean(x["scores"]))[:3]
-        return [d["doc"] for d in top_laws], [d["doc"] for d in top_judgments]
+
+        timings["queries"] = len(queries) * 2
+        timings["unique_ids"] = len(scores["law"]) + len(scores["judgment"])
+        st.session_state["retrieval_timings"] = timings
+        # החוקים מגיעים עם הסעיפים שנמצאו תואמים, לפי סדר ההתאמה
+        laws = [
+            {**d["doc"], "MatchedSections": sorted(sections.get(d["doc"]["IsraelLawID"], {}).values(),
+                                                    key=lambda s: -s["score"])[:3]}
+            for d in top_laws
+        ]
+        return laws, [d["doc"] for d in top_judgments]
 
         # ---------- answer ----------
-    async def generate_answer(question: str):
+    async def generate_answer(question: str, on_text=None):
+        """Stream the answer, passing the text so far to `on_text`; returns the final text."""
         laws, judgments = await retrieve_sources(question)
-        doc_text = st.session_state.get("uploaded_doc_text", "")[:1500]
+        doc_text = truncate_to_tokens(uploaded_doc_text(),
+                                      budget_for("document"), ANSWER_MODEL)
 
         if not laws and not judgments and not doc_text:
             return "לא נמצאו חוקים, פסקי-דין או מסמך רלוונטי למתן תשובה מוסמכת."
@@ -368,8 +439,14 @@ def chat_assistant():
         # ניצור snippet מפורמט - כולל שם חוק/פס"ד והמספר
         def get_law_snip(law):
             name = law.get("Name", "חוק לא מזוהה")
-            desc = law.get("Description", "")[:800]
             law_id = law.get("IsraelLawID", "")
+            if law.get("MatchedSections"):
+                desc = "\n".join(
+                    f"סעיף {s['SectionNumber']} {s['SectionDescription']}: {s['SectionContent']}"
+                    for s in law["MatchedSections"]
+                )
+            else:
+                desc = law.get("Description", "")[:800]
             return f"שם החוק: {name} (מס' מזהה: {law_id})\n{desc}"
 
         def get_judgment_snip(judgment):
@@ -378,8 +455,10 @@ def chat_assistant():
             num = judgment.get("CaseNumber", "")
             return f"שם פסק הדין: {name} (מס' תיק: {num})\n{desc}"
 
-        law_snip = "\n\n".join(get_law_snip(d) for d in laws)
-        jud_snip = "\n\n".join(get_judgment_snip(d) for d in judgments)
+        # חצי מתקציב המקורות לחוקים וחצי לפסקי הדין, לפי סדר הדירוג
+        sources_budget = budget_for("sources") // 2
+        law_snip = "\n\n".join(fit_snippets([get_law_snip(d) for d in laws], sources_budget, ANSWER_MODEL))
+        jud_snip = "\n\n".join(fit_snippets([get_judgment_snip(d) for d in judgments], sources_budget, ANSWER_MODEL))
 
         sys_prompt = (
             "אתה עורך-דין ישראלי מקצועי, אמין, קפדן ובלתי מתפשר על דיוק. תפקידך לנסח תשובה משפטית מקצועית, מנומקת, מפורטת, מעשית וברורה – אך ורק בעברית.\n"
@@ -411,31 +490,50 @@ def chat_assistant():
 
         
         messages = [{"role": "system", "content": sys_prompt}]
-        for msg in st.session_state["messages"]:
+        # ההודעות האחרונות שנכנסות בתקציב; הישנות יותר מסוכמות (סיכום מצטבר שנשמר לכל שיחה)
+        older, recent = split_history(st.session_state["messages"], budget_for("history"), ANSWER_MODEL)
+        if older:
+            summary = await asyncio.to_thread(
+                update_summary, chat_id, older, st.session_state.get("history_start", 0), summarize_history)
+            if summary:
+                messages.append({"role": "system", "content": "סיכום השיחה הקודמת:\n" + summary})
+        for msg in recent:
             role = "user" if msg["role"] == "user" else "assistant"
             messages.append({"role": role, "content": msg["content"]})
 
         messages.append({"role": "user", "content": question})
 
-        r = await client_async_openai.chat.completions.create(
-            model="gpt-4o-mini",
+        started = time.perf_counter()
+        stream = await client_async_openai.chat.completions.create(
+            model=ANSWER_MODEL,
             messages=messages,   
             temperature=0,
             max_tokens=1200,
+            stream=True,
         )
-        return r.choices[0].message.content.strip()
+        answer, llm_timings = await astream_completion(stream, started, on_text)
+        st.session_state["retrieval_timings"].update(first_token=llm_timings["first_token"], answer=llm_timings["total"])
+        return answer
 
 
 
     # ---------- handle question ----------
     async def handle_question(q):
-        ans = await generate_answer(q)
-        add_message("user", q)
-        add_message("assistant", ans)
-        conversation_coll.update_one(
-            {"local_storage_id": chat_id},
-            {"$set": {"messages": st.session_state["messages"], "user_name": st.session_state["user_name"]}},
-            upsert=True,
+        asked_at = datetime.now().strftime("%H:%M:%S")
+
+        def show(text, typing=True):
+            with answer_slot.container():
+                st.markdown(message_html("user", q, asked_at), unsafe_allow_html=True)
+                st.markdown(message_html("assistant", text + (" ▌" if typing else ""), asked_at),
+                            unsafe_allow_html=True)
+
+        show("⏳")
+        ans = await generate_answer(q, on_text=show)
+        show(ans, typing=False)
+        conversation_store.append(
+            chat_id,
+            [add_message("user", q), add_message("assistant", ans)],
+            user_name=st.session_state["user_name"],
         )
         st.rerun()
 
@@ -445,10 +543,16 @@ def chat_assistant():
         if st.form_submit_button("שלח") and q.strip():
             asyncio.run(handle_question(q.strip()))
 
+    # ---------- document status & type ----------
+    if uploaded:
+        show_doc_status(doc_status_slot)
+        doc_type_slot.success(f"📄 סוג המסמך שזוהה: {current_doc_type()}")
+
     # ---------- clear ----------
     if st.button("🗑 נקה שיחה"):
-        conversation_coll.delete_one({"local_storage_id": chat_id})
-        st_js("localStorage.clear();")
+        conversation_store.delete(chat_id)
+        forget_summary(chat_id)
+        reset_chat_id()
         st.session_state.clear()
         st.rerun()
 
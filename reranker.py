@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+
+RERANKER_MODEL_NAME = os.getenv("RERANKER_MODEL_NAME", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+# Vector-search candidates passed to the reranker per query
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+# Logistic calibration applied in logit space: 10 * sigmoid(scale * logit + shift)
+RERANK_SCALE = float(os.getenv("RERANK_SCALE", "1.0"))
+RERANK_SHIFT = float(os.getenv("RERANK_SHIFT", "0.0"))
+
+
+def calibrate(probabilities, scale=RERANK_SCALE, shift=RERANK_SHIFT):
+    """Map the cross-encoder's sigmoid outputs onto a 0-10 relevance score.
+
+    With the default scale and shift this is just 10 * probability; tuning
+    them stretches or moves the curve without retraining the model.
+    """
+    p = np.clip(np.asarray(probabilities, dtype=np.float64), 1e-6, 1 - 1e-6)
+    logits = np.log(p / (1 - p))
+    return 10.0 / (1.0 + np.exp(-(scale * logits + shift)))
+
+
+def rerank(model, query, texts, batch_size=RERANK_BATCH_SIZE):
+    """Calibrated 0-10 scores for every (query, text) pair, in one batched forward pass."""
+    if not texts:
+        return np.empty(0)
+    probabilities = model.predict([(query, text) for text in texts], batch_size=batch_size,
+                                  convert_to_numpy=True, show_progress_bar=False)
+    return calibrate(probabilities)
+
+
+def rerank_results(model, query, results, text_of, top_n):
+    """Sort result dicts by relevance (stored under "relevance"), keeping the best `top_n`."""
+    scores = rerank(model, query, [text_of(result) for result in results])
+    for result, score in zip(results, scores):
+        result["relevance"] = round(float(score), 1)
+    return sorted(results, key=lambda result: -result["relevance"])[:top_n]
@@ -0,0 +1,62 @@
+"""Resolve the chat id once per browser session and load its conversation in the background.
+
+The id is the only key to a conversation, so it never goes into the URL: it
+is looked up in st.session_state and, on the first load of a browser session
+only, in localStorage. Stored values that aren't a UUID are ignored, and a
+new id is written back without blocking or rerunning.
+"""
+import json
+import re
+import uuid
+
+import streamlit as st
+from streamlit_js import st_js, st_js_blocking
+
+from background import run_in_background
+
+CHAT_ID_STORAGE_KEY = "MiniLawyerChatId"
+CHAT_ID_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def _valid_chat_id(value):
+    return value if isinstance(value, str) and CHAT_ID_PATTERN.match(value) else None
+
+
+def resolve_chat_id():
+    """The chat id for this browser session, creating one on the first visit."""
+    chat_id = st.session_state.get("current_chat_id")
+    if chat_id:
+        return chat_id
+
+    storage_key = json.dumps(CHAT_ID_STORAGE_KEY)
+    stored = st_js_blocking(f"return localStorage.getItem({storage_key});",
+                            key="get_" + CHAT_ID_STORAGE_KEY)
+    chat_id = _valid_chat_id(stored)
+    if not chat_id:
+        chat_id = str(uuid.uuid4())
+        st_js(f"localStorage.setItem({storage_key}, {json.dumps(chat_id)});")
+    st.session_state["current_chat_id"] = chat_id
+    return chat_id
+
+
+def reset_chat_id():
+    """Forget the current id (e.g. after clearing the chat); the next resolve creates a new one."""
+    st.session_state.pop("current_chat_id", None)
+    st.session_state.pop("conversation_future", None)
+    st_js(f"localStorage.removeItem({json.dumps(CHAT_ID_STORAGE_KEY)});")
+
+
+def start_conversation_load(store, chat_id):
+    """Start loading the chat's recent messages on a worker thread, once per session.
+
+    Call it as early as possible and collect the result with
+    `conversation_result()` once the page chrome has been rendered.
+    """
+    pending = st.session_state.get("conversation_future")
+    if pending is None or pending[0] != chat_id:
+        st.session_state["conversation_future"] = (chat_id, run_in_background(store.load_recent, chat_id))
+
+
+def conversation_result():
+    """(user_name, messages, total) from `start_conversation_load`, waiting if it hasn't finished."""
+    return st.session_state["conversation_future"][1].result()
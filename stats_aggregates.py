@@ -0,0 +1,44 @@
+import pandas as pd
+
+
+def year_of(field):
+    """Calendar year of a date field; null when the value isn't a date."""
+    return {"$year": {"$convert": {"input": field, "to": "date", "onError": None, "onNull": None}}}
+
+
+# Facet name -> grouping expression
+JUDGMENT_FACETS = {
+    "Year": year_of("$DecisionDate"),
+    "CourtType": "$CourtType",
+    "ProcedureType": "$ProcedureType",
+    "District": "$District",
+}
+LAW_FACETS = {
+    "Year": year_of("$PublicationDate"),
+    "IsBasicLaw": "$IsBasicLaw",
+    "IsFavoriteLaw": "$IsFavoriteLaw",
+}
+
+
+def facet_counts(collection, facets):
+    """Document counts per value of each facet, computed server-side in one aggregation.
+
+    Returns {facet name: DataFrame with columns [name, "count"]}, sorted by
+    value; documents where the facet is missing or null are left out.
+    """
+    pipeline = [{"$facet": {
+        name: [
+            {"$group": {"_id": expression, "count": {"$sum": 1}}},
+            {"$match": {"_id": {"$ne": None}}},
+            {"$sort": {"_id": 1}},
+        ]
+        for name, expression in facets.items()
+    }}]
+    result = next(collection.aggregate(pipeline, allowDiskUse=True), {})
+    return {
+        name: pd.DataFrame(
+            [{name: row["_id"], "count": row["count"]} for row in result.get(name, [])],
+            columns=[name, "count"],
+        )
+        for name in facets
+    }
@@ -0,0 +1,151 @@
+import math
+import re
+from collections import defaultdict
+
+# ------------------------------------------------------------
+# Hebrew tokenization
+# ------------------------------------------------------------
+# One-letter prefixes (ו, ה, ב, ל, מ, ש, כ) are glued to the word they modify,
+# so "והחוק", "בחוק" and "לחוק" should all match "חוק". A leading letter may
+# also be part of the root ("שמירה" is not ש + "מירה"), so the corpus acts as
+# the lexicon: a word's stripped form is searchable (at PREFIX_VARIANT_WEIGHT)
+# only if it also occurs as a word on its own, and stripping stops at the first
+# form that doesn't. Query words are looked up as typed. Where both readings
+# are real words (e.g. "שמירה" next to a standalone "מירה") they still merge.
+HEBREW_PREFIXES = "והבלמשכ"
+MAX_PREFIX_LETTERS = 3
+MIN_STEM_LENGTH = 3
+PREFIX_VARIANT_WEIGHT = 0.5
+
+NIQQUD_RE = re.compile(r"[\u0591-\u05C7]")
+# Gershayim / geresh inside abbreviations: בג"ץ, ביהמ"ש, ע׳
+ABBREVIATION_QUOTES_RE = re.compile(r"(?<=[א-ת])[\"'׳״](?=[א-ת])")
+TOKEN_RE = re.compile(r"[א-תa-z0-9]+")
+FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+
+
+def normalize_token(token: str) -> str:
+    return token.translate(FINAL_LETTERS)
+
+
+def prefix_variants(token: str) -> list:
+    """`token` without 1..MAX_PREFIX_LETTERS leading prefix letters, longest first."""
+    variants = []
+    while (len(variants) < MAX_PREFIX_LETTERS and token[0] in HEBREW_PREFIXES
+           and len(token) - 1 >= MIN_STEM_LENGTH):
+        token = token[1:]
+        variants.append(token)
+    return variants
+
+
+def tokenize(text) -> list:
+    if not isinstance(text, str):
+        return []
+    text = NIQQUD_RE.sub("", text.lower())
+    text = ABBREVIATION_QUOTES_RE.sub("", text)
+    return [normalize_token(t) for t in TOKEN_RE.findall(text)]
+
+
+# ------------------------------------------------------------
+# Inverted index
+# ------------------------------------------------------------
+class TextIndex:
+    """In-memory BM25 index over the Name and Description of a collection.
+
+    Name hits count FIELD_WEIGHTS["Name"] times as much as Description hits.
+    Documents are identified by their Mongo `_id`.
+    """
+
+    FIELD_WEIGHTS = {"Name": 3, "Description": 1}
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.doc_ids = []
+        self.doc_lengths = []
+        self.postings = defaultdict(dict)  # word as written -> {doc position: weighted tf}
+        self._search_postings = None  # postings plus stripped forms, rebuilt after adds
+
+    @classmethod
+    def from_collection(cls, collection, batch_size=2000):
+        index = cls()
+        cursor = collection.find({}, {field: 1 for field in cls.FIELD_WEIGHTS})
+        for doc in cursor.batch_size(batch_size):
+            index.add(doc)
+        index._search_postings = index._build_search_postings()
+        return index
+
+    def add(self, doc):
+        position = len(self.doc_ids)
+        self.doc_ids.append(doc["_id"])
+        length = 0
+        for field, weight in self.FIELD_WEIGHTS.items():
+            for term in tokenize(doc.get(field)):
+                postings = self.postings[term]
+                postings[position] = postings.get(position, 0) + weight
+                length += weight
+        self.doc_lengths.append(length)
+        self._search_postings = None
+
+    def stripped_forms(self, term):
+        """Prefix-stripped forms of `term` that occur as words in the index, longest first."""
+        forms = []
+        for variant in prefix_variants(term):
+            if variant not in self.postings:
+                break
+            forms.append(variant)
+        return forms
+
+    def _build_search_postings(self):
+        merged = dict(self.postings)
+        for term, postings in self.postings.items():
+            for form in self.stripped_forms(term):
+                if merged[form] is self.postings[form]:
+                    merged[form] = dict(self.postings[form])
+                target = merged[form]
+                for position, tf in postings.items():
+                    target[position] = target.get(position, 0) + tf * PREFIX_VARIANT_WEIGHT
+        return merged
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def _term_postings(self, term):
+        if self._search_postings is None:
+            self._search_postings = self._build_search_postings()
+        # A prefixed query word no document contains falls back to its stripped forms
+        for candidate in [term] + prefix_variants(term):
+            postings = self._search_postings.get(candidate)
+            if postings:
+                return postings
+        return None
+
+    def search(self, query: str) -> list:
+        """Return [(_id, score)] for documents containing every query term, best first."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.doc_ids:
+            return []
+        term_postings = [self._term_postings(term) for term in terms]
+        if not all(term_postings):
+            return []
+
+        # Intersect starting from the rarest term
+        term_postings.sort(key=len)
+        matches = set(term_postings[0])
+        for postings in term_postings[1:]:
+            matches.intersection_update(postings)
+            if not matches:
+                return []
+
+        n_docs = len(self.doc_ids)
+        avg_length = sum(self.doc_lengths) / n_docs or 1
+        scores = dict.fromkeys(matches, 0.0)
+        for postings in term_postings:
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position in matches:
+                tf = postings[position]
+                norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[position] / avg_length)
+                scores[position] += idf * tf * (self.K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(self.doc_ids[position], score) for position, score in ranked]
@@ -0,0 +1,245 @@
+import json
+import os
+
+import numpy as np
+
+from embedding_service import PASSAGE_PREFIX
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", os.path.join(PROJECT_ROOT, "data", "vector_store"))
+# Number of IVF lists probed per query; more is slower but closer to exact search
+IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "8"))
+
+# Section-granular law index: one vector per entry of a law's Segments
+SECTION_INDEX_NAME = "laws-sections"
+# Set LAW_SECTION_SEARCH=0 to search laws by name only
+LAW_SECTION_SEARCH = os.getenv("LAW_SECTION_SEARCH", "1") == "1"
+# Section matches fetched per law requested, before collapsing to laws
+SECTION_FANOUT = 4
+# Section text kept in the match metadata for the prompt builder
+SECTION_CONTENT_CHARS = 1000
+
+# Index name -> (Mongo collection, id field kept in the match metadata)
+INDEX_SOURCES = {
+    "laws-names": ("laws", "IsraelLawID"),
+    "judgments-names": ("judgments", "CaseNumber"),
+    SECTION_INDEX_NAME: ("laws", "IsraelLawID"),
+}
+# Document fields each index embeds
+INDEX_FIELDS = {
+    "laws-names": ["Name"],
+    "judgments-names": ["Name"],
+    SECTION_INDEX_NAME: ["Name", "Segments"],
+}
+
+
+def document_text(doc):
+    """Text embedded for a law/judgment, using the e5 passage prefix."""
+    return f"{PASSAGE_PREFIX}{doc.get('Name', '')}"
+
+
+def document_records(index_name, doc):
+    """The {"id", "text", "metadata"} records a Mongo document contributes to `index_name`."""
+    _, key_field = INDEX_SOURCES[index_name]
+    key = doc.get(key_field)
+    if key is None:
+        return []
+    name = doc.get("Name") or ""
+    if index_name != SECTION_INDEX_NAME:
+        return [{"id": str(key), "text": document_text(doc), "metadata": {key_field: key, "Name": name}}]
+
+    records = []
+    for position, segment in enumerate(doc.get("Segments") or []):
+        content = (segment.get("SectionContent") or "").strip()
+        if not content:
+            continue
+        number = str(segment.get("SectionNumber") or "")
+        description = segment.get("SectionDescription") or ""
+        records.append({
+            "id": f"{key}:{position}",
+            "text": f"{PASSAGE_PREFIX}{name} - סעיף {number} {description}\n{content}",
+            "metadata": {
+                key_field: key,
+                "Name": name,
+                "SectionNumber": number,
+                "SectionDescription": description,
+                "SectionContent": content[:SECTION_CONTENT_CHARS],
+            },
+        })
+    return records
+
+
+def collapse_section_matches(matches, top_k=None, sections_per_law=3):
+    """Group section matches by law, scoring each law by its best section.
+
+    Returns [{"IsraelLawID", "score", "sections"}] best first, where
+    `sections` holds the metadata of up to `sections_per_law` matching
+    sections (best first) plus their "score".
+    """
+    laws = {}
+    for match in matches:
+        meta = match.get("metadata", {})
+        law_id = meta.get("IsraelLawID")
+        if law_id is None:
+            continue
+        law = laws.setdefault(law_id, {"IsraelLawID": law_id, "score": match.get("score", 0), "sections": []})
+        law["score"] = max(law["score"], match.get("score", 0))
+        if len(law["sections"]) < sections_per_law:
+            law["sections"].append({**meta, "score": match.get("score", 0)})
+    ranked = sorted(laws.values(), key=lambda law: -law["score"])
+    return ranked[:top_k] if top_k else ranked
+
+
+def search_law_sections(index, vector, top_k=5, sections_per_law=3):
+    """Top `top_k` laws for `vector` on the section index, with their matching sections."""
+    response = index.query(vector=list(map(float, vector)), top_k=top_k * SECTION_FANOUT, include_metadata=True)
+    return collapse_section_matches(response.get("matches", []), top_k, sections_per_law)
+
+
+class LocalVectorIndex:
+    """File-backed stand-in for a Pinecone index.
+
+    Vectors live in VECTOR_STORE_DIR/<name>/vectors.npy as a float32 matrix
+    that is memory-mapped on load, with ids and metadata in meta.json. Queries
+    score by dot product (cosine for the normalized e5 embeddings) and return
+    the same {"matches": [{"id", "score", "metadata"}]} shape as Pinecone.
+    When ivf.npz exists, only the IVF_NPROBE nearest lists are scanned.
+    """
+
+    def __init__(self, name, directory=VECTOR_STORE_DIR):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._pending = {}
+        self._loaded_mtime = None
+        self._load()
+
+    # ---------- files ----------
+    def _file(self, filename):
+        return os.path.join(self.path, filename)
+
+    def _load(self):
+        vectors_file = self._file("vectors.npy")
+        if not os.path.exists(vectors_file):
+            self.ids, self.metadata = [], []
+            self.vectors = np.empty((0, 0), dtype=np.float32)
+            self.ivf = None
+            return
+        self._loaded_mtime = os.path.getmtime(vectors_file)
+        with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ids, self.metadata = meta["ids"], meta["metadata"]
+        self.vectors = np.load(vectors_file, mmap_mode="r")
+        self.ivf = dict(np.load(self._file("ivf.npz"))) if os.path.exists(self._file("ivf.npz")) else None
+
+    def _reload_if_changed(self):
+        vectors_file = self._file("vectors.npy")
+        if os.path.exists(vectors_file) and os.path.getmtime(vectors_file) != self._loaded_mtime:
+            self._load()
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ---------- query ----------
+    def query(self, vector, top_k=10, include_metadata=True, nprobe=IVF_NPROBE, **kwargs):
+        self._reload_if_changed()
+        if not self.ids:
+            return {"matches": []}
+        query = np.asarray(vector, dtype=np.float32)
+
+        if self.ivf is not None:
+            centroid_scores = self.ivf["centroids"] @ query
+            lists = np.argsort(-centroid_scores)[:nprobe]
+            offsets = self.ivf["offsets"]
+            rows = np.sort(np.concatenate([self.ivf["rows"][offsets[i]:offsets[i + 1]] for i in lists]))
+            scores = self.vectors[rows] @ query
+        else:
+            rows = None
+            scores = self.vectors @ query
+
+        k = min(top_k, len(scores))
+        if k == 0:
+            return {"matches": []}
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        matches = []
+        for position in top:
+            row = int(rows[position]) if rows is not None else int(position)
+            match = {"id": self.ids[row], "score": float(scores[position])}
+            if include_metadata:
+                match["metadata"] = self.metadata[row]
+            matches.append(match)
+        return {"matches": matches}
+
+    # ---------- writes ----------
+    def upsert(self, vectors, **kwargs):
+        """Stage Pinecone-style {"id", "values", "metadata"} records; call save() to persist."""
+        for record in vectors:
+            self._pending[str(record["id"])] = (
+                np.asarray(record["values"], dtype=np.float32), record.get("metadata", {}))
+        return {"upserted_count": len(vectors)}
+
+    def save(self, ivf_lists=None):
+        """Merge staged upserts into the files.
+
+        The IVF index is rebuilt with `ivf_lists` lists, or with the current
+        number of lists when one already exists.
+        """
+        self._reload_if_changed()
+        if ivf_lists is None and self.ivf is not None:
+            ivf_lists = len(self.ivf["centroids"])
+        positions = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        ids, metadata = list(self.ids), list(self.metadata)
+        dim = self.vectors.shape[1] if len(self.ids) else (
+            len(next(iter(self._pending.values()))[0]) if self._pending else 0)
+        vectors = np.empty((len(ids) + len(self._pending), dim), dtype=np.float32)
+        if ids:
+            vectors[:len(ids)] = self.vectors
+        for doc_id, (values, meta) in self._pending.items():
+            if doc_id in positions:
+                row = positions[doc_id]
+                metadata[row] = meta
+            else:
+                row = len(ids)
+                ids.append(doc_id)
+                metadata.append(meta)
+            vectors[row] = values
+        vectors = vectors[:len(ids)]
+
+        os.makedirs(self.path, exist_ok=True)
+        tmp_vectors = self._file("vectors.tmp.npy")
+        np.save(tmp_vectors, vectors)
+        with open(self._file("meta.tmp.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "metadata": metadata}, f, ensure_ascii=False, default=str)
+        if ivf_lists:
+            np.savez(self._file("ivf.tmp.npz"), **build_ivf(vectors, ivf_lists))
+            os.replace(self._file("ivf.tmp.npz"), self._file("ivf.npz"))
+        elif os.path.exists(self._file("ivf.npz")):
+            os.remove(self._file("ivf.npz"))
+        os.replace(self._file("meta.tmp.json"), self._file("meta.json"))
+        os.replace(tmp_vectors, self._file("vectors.npy"))
+        self._pending = {}
+        self._load()
+
+
+def build_ivf(vectors, n_lists, iterations=10, sample_size=50000, seed=0):
+    """Spherical k-means coarse quantizer: centroids plus row ids grouped per list."""
+    rng = np.random.default_rng(seed)
+    n_lists = max(1, min(n_lists, len(vectors)))
+    sample = vectors[rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for i in range(n_lists):
+            members = sample[assignment == i]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[i] = centroid / (np.linalg.norm(centroid) or 1)
+
+    assignment = np.concatenate([
+        np.argmax(vectors[start:start + 10000] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), 10000)
+    ])
+    rows = np.argsort(assignment, kind="stable").astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))]).astype(np.int64)
+    return {"centroids": centroids.astype(np.float32), "rows": rows, "offsets": offsets}
+